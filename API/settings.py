@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import random
 from pathlib import Path
 from datetime import timedelta
 from decouple import config, Csv
@@ -50,6 +51,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'main.middleware.MetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -158,7 +160,17 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    # orjson-backed JSON with the same output as DRF's (stdlib json when orjson isn't installed)
+    'DEFAULT_RENDERER_CLASSES': [
+        'main.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'main.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'main.pagination.StandardResultsPagination',
     'PAGE_SIZE': 5,
     # For throttling requests to the API
     'DEFAULT_THROTTLE_CLASSES': [
@@ -186,6 +198,9 @@ SPECTACULAR_SETTINGS = {
     'SERVE_INCLUDE_SCHEMA': False,
     # OTHER SETTINGS
 }
+
+# Serialize products, orders and carts through precompiled field accessors (main/representation.py)
+FAST_READ_SERIALIZERS = config('FAST_READ_SERIALIZERS', default=True, cast=bool)
     
 # For defining the cache backend
 CACHES = {
@@ -198,6 +213,14 @@ CACHES = {
     }
 }
 
+# Anonymous carts live in the cache (a Redis hash per cart) until the user logs in
+ANONYMOUS_CARTS = config('ANONYMOUS_CARTS', default=False, cast=bool)
+CART_TTL = config('CART_TTL', default=60 * 60 * 24 * 7, cast=int)
+
+# Responses replayed for retried requests carrying an Idempotency-Key ('cache' falls back to 'db' if Redis is down)
+IDEMPOTENCY_STORE = config('IDEMPOTENCY_STORE', default='cache')
+IDEMPOTENCY_TTL = config('IDEMPOTENCY_TTL', default=60 * 60 * 24, cast=int)
+
 SIMPLEJWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=0, seconds=0, microseconds=0, milliseconds=0, minutes=60, hours=0, weeks=0) , 
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1, seconds=0, microseconds=0, milliseconds=0, minutes=0, hours=0, weeks=0),  # 7 days
@@ -208,6 +231,44 @@ CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='redis://127.0.0.1:6379/
 # Tell celery where to store task results
 CELERY_RESULT_BACKEND = config('CELERY_RESULT_BACKEND', default='redis://127.0.0.1:6379/1')
 
+CELERY_BEAT_SCHEDULE = {
+    'release-expired-reservations': {
+        'task': 'main.tasks.release_expired_reservations',
+        'schedule': timedelta(minutes=5),
+    },
+    'purge-idempotency-records': {
+        'task': 'main.tasks.purge_idempotency_records',
+        'schedule': timedelta(hours=1),
+    },
+}
+
+# Pending orders older than this are cancelled and their reserved stock released
+RESERVATION_HOLD_MINUTES = config('RESERVATION_HOLD_MINUTES', default=60, cast=int)
+RESERVATION_SWEEP_BATCH_SIZE = config('RESERVATION_SWEEP_BATCH_SIZE', default=500, cast=int)
+
+# Request metrics served at /metrics (Prometheus text format). Scrapes must send
+# "Authorization: Bearer <token>"; without a token the endpoint is only open in DEBUG
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Silk records every query of a profiled request into the database, so only profile a
+# sample of requests, plus any request sending the X-Silk-Profile header (whose value
+# must match SILK_PROFILE_TOKEN when one is set)
+SILK_SAMPLE_RATE = config('SILK_SAMPLE_RATE', default=0.01, cast=float)
+SILK_PROFILE_TOKEN = config('SILK_PROFILE_TOKEN', default='')
+
+
+def silk_intercept(request):
+    from django.conf import settings
+
+    header = request.headers.get('X-Silk-Profile')
+    if header and (header == settings.SILK_PROFILE_TOKEN if settings.SILK_PROFILE_TOKEN else settings.DEBUG):
+        return True
+    return random.random() < settings.SILK_SAMPLE_RATE
+
+
+SILKY_INTERCEPT_FUNC = silk_intercept
+
 # Email Configuration
 EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.console.EmailBackend')
 EMAIL_HOST = config('EMAIL_HOST', default='smtp.gmail.com')
@@ -23,12 +23,15 @@ from rest_framework_simplejwt.views import (
     TokenRefreshView,
 )
 from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
+from main.metrics import metrics_view
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('silk/', include('silk.urls', namespace='silk')),
     path('api/', include('main.urls')),  # Include the URLs from the main app
+    # Prometheus scrape endpoint
+    path('metrics', metrics_view, name='metrics'),
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     # The benefit of this url is to: refresh the token if your token expired
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
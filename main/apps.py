@@ -7,3 +7,8 @@ class MainConfig(AppConfig):
     
     def ready(self):
         from . import signals  # Import signals to ensure they are registered
+        from django.conf import settings
+        from .metrics import instrument_serializers
+        # The serializer timing wraps DRF's classes, so leave them alone unless metrics are collected
+        if getattr(settings, 'METRICS_ENABLED', True):
+            instrument_serializers()
@@ -0,0 +1,301 @@
+"""
+Endpoint benchmark suite.
+
+Every route in ``main/urls.py`` and the router is exercised against whatever
+data is in the database (seed it with ``seed_data --products ...`` first).
+Each endpoint records p50/p95 latency, the number of database queries and
+the bytes of the response body. Results are compared with the budgets in
+``benchmark_budgets.json`` and, optionally, with a previous run.
+
+The committed budgets were measured on ``seed_data --products 100000
+--users 10000 --orders 50000 --seed 1`` (SQLite): query counts are exact,
+latency budgets allow 3x the measured p95 and byte budgets 1.25x the size.
+They are targets, not snapshots: an endpoint that misbehaves at that scale
+(an N+1, a quadratic query) is fixed rather than given a budget to match.
+
+Every request runs in a transaction that is rolled back, so cart mutations
+and checkouts leave the database untouched (and never fire on-commit work
+such as confirmation emails).
+"""
+import json
+import statistics
+import time
+import timeit
+from contextlib import ExitStack
+from pathlib import Path
+from unittest import mock
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Prefetch
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.views import APIView
+
+from .caching import CATALOG, PRODUCT_LIST, bump, order_tag
+from .models import Cart, CartItem, Category, Order, Product, Review, User
+from .renderers import FastJSONRenderer
+from .serializers import CartSerializer, OrderSerializer, ProductSerializer
+
+BUDGETS_PATH = Path(__file__).with_name('benchmark_budgets.json')
+METRICS = ('p50_ms', 'p95_ms', 'queries', 'bytes')
+
+
+class Endpoint:
+    def __init__(self, name, method, url, data=None, user=None, setup=None):
+        self.name = name
+        self.method = method
+        self.url = url
+        self.data = data
+        self.user = user
+        self.setup = setup
+
+
+def fill_cart(user, products, quantity=1):
+    cart, _ = Cart.objects.get_or_create(user=user)
+    CartItem.objects.filter(cart=cart).delete()
+    CartItem.objects.bulk_create(CartItem(cart=cart, product=product, quantity=quantity) for product in products)
+
+
+def build_endpoints():
+    """The benchmarked requests, built around representative rows of the current dataset."""
+    customer = User.objects.annotate(order_count=Count('orders')).order_by('-order_count', 'pk').first()
+    admin = User.objects.filter(is_superuser=True).order_by('pk').first()
+    products = list(
+        Product.objects.filter(is_active=True, stock__gt=F('reserved_stock')).order_by('-rating_count', 'pk')[:5]
+    )
+    category = Category.objects.annotate(product_count=Count('products')).order_by('-product_count', 'pk').first()
+    if customer is None or not products or category is None:
+        raise ValueError('The database needs users, in-stock products and categories; run seed_data first.')
+    product = products[0]
+    order = Order.objects.filter(user=customer).order_by('-created_at').first()
+    review = Review.objects.filter(product=product).order_by('pk').first()
+    lines = [{'product': p.pk, 'quantity': 1} for p in products]
+
+    endpoints = [
+        Endpoint('product-list', 'get', reverse('products')),
+        Endpoint('product-list-filtered', 'get', reverse('products'),
+                 {'category': category.pk, 'descendants': 'true', 'ordering': 'price'}),
+        Endpoint('product-search', 'get', reverse('products'), {'q': product.name.split()[0]}),
+        Endpoint('product-detail', 'get', reverse('product-detail', kwargs={'pk': product.pk})),
+        Endpoint('product-info', 'get', reverse('product-info')),
+        Endpoint('product-info-summary', 'get', reverse('product-info'), {'include': 'summary'}),
+        Endpoint('category-list', 'get', reverse('category-list')),
+        Endpoint('category-tree', 'get', reverse('category-tree')),
+        Endpoint('category-detail', 'get', reverse('category-detail', kwargs={'slug': category.slug})),
+        Endpoint('review-list', 'get', reverse('review-list'), {'product': product.pk}),
+        Endpoint('order-list', 'get', reverse('order-list'), user=customer),
+        Endpoint('user-orders', 'get', reverse('user-orders'), user=customer),
+        Endpoint('profile-list', 'get', reverse('profile-list'), user=customer),
+        Endpoint('profile-me', 'get', reverse('profile-me'), user=customer),
+        Endpoint('cart-me', 'get', reverse('cart-me'), user=customer,
+                 setup=lambda: fill_cart(customer, products)),
+        Endpoint('cart-add-item', 'post', reverse('cart-add-item'), {'product': product.pk, 'quantity': 1},
+                 user=customer, setup=lambda: fill_cart(customer, products[1:])),
+        Endpoint('cart-update-item', 'put', reverse('cart-update-item'), {'product': product.pk, 'quantity': 2},
+                 user=customer, setup=lambda: fill_cart(customer, products)),
+        Endpoint('cart-remove-item', 'delete', reverse('cart-remove-item'), {'product': product.pk},
+                 user=customer, setup=lambda: fill_cart(customer, products)),
+        Endpoint('cart-batch-items', 'patch', reverse('cart-items'), {'items': lines}, user=customer,
+                 setup=lambda: fill_cart(customer, [])),
+        Endpoint('cart-clear', 'delete', reverse('cart-clear'), user=customer,
+                 setup=lambda: fill_cart(customer, products)),
+        Endpoint('cart-checkout', 'post', reverse('cart-checkout'), {}, user=customer,
+                 setup=lambda: fill_cart(customer, products)),
+        Endpoint('order-create', 'post', reverse('order-list'), {'items': lines}, user=customer),
+    ]
+    if review is not None:
+        endpoints.append(Endpoint('review-detail', 'get', reverse('review-detail', kwargs={'pk': review.pk})))
+    if order is not None:
+        endpoints.append(Endpoint('order-detail', 'get', reverse('order-detail', kwargs={'pk': order.pk}), user=customer))
+    if admin is not None:
+        endpoints += [
+            Endpoint('user-list', 'get', reverse('user-list'), user=admin),
+            Endpoint('cache-stats', 'get', reverse('cache-stats'), user=admin),
+        ]
+    if admin is not None and order is not None:
+        # Cancelling releases the order's reserved stock, the heaviest transition
+        endpoints.append(Endpoint(
+            'order-update-status', 'post', reverse('order-update-status', kwargs={'pk': order.pk}),
+            {'status': Order.StatusChoices.CANCELLED}, user=admin,
+            setup=lambda: Order.objects.filter(pk=order.pk).update(status=Order.StatusChoices.PENDING),
+        ))
+    return endpoints
+
+
+class QueryRecorder:
+    """
+    ``execute_wrapper`` collecting the SQL of every statement. Unlike
+    CaptureQueriesContext it isn't capped by the 9000-entry query log, so
+    endpoints with very many queries are counted exactly.
+    """
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.statements.append(sql)
+        return execute(sql, params, many, context)
+
+
+def app_queries(statements):
+    """Statements issued by the application, leaving out savepoints and silk's profiling queries."""
+    return [
+        sql for sql in statements
+        if sql.startswith(('SELECT', 'INSERT', 'UPDATE', 'DELETE')) and 'silk_' not in sql
+    ]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))]
+
+
+def measure(endpoint, repeat, warm=False):
+    client = APIClient()
+    client.force_authenticate(endpoint.user)
+    timings, query_counts, sizes, statuses = [], [], [], set()
+
+    for _ in range(repeat):
+        if not warm:
+            # Invalidate the cached product and order endpoints so each request does the real work
+            bump(CATALOG, PRODUCT_LIST, *([order_tag(endpoint.user.pk)] if endpoint.user else []))
+        with transaction.atomic():
+            if endpoint.setup is not None:
+                endpoint.setup()
+            queries = QueryRecorder()
+            with connection.execute_wrapper(queries):
+                start = time.perf_counter()
+                response = getattr(client, endpoint.method)(endpoint.url, endpoint.data, format='json')
+                body = b''.join(response.streaming_content) if response.streaming else response.content
+                timings.append((time.perf_counter() - start) * 1000)
+            transaction.set_rollback(True)
+        query_counts.append(len(app_queries(queries.statements)))
+        sizes.append(len(body))
+        statuses.add(response.status_code)
+
+    return {
+        'p50_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(percentile(timings, 95), 2),
+        'queries': max(query_counts),
+        'bytes': max(sizes),
+        'status': sorted(statuses),
+    }
+
+
+def run(repeat=20, warm=False, only=None):
+    """Benchmark every endpoint and return ``{name: metrics}``."""
+    middleware = [m for m in settings.MIDDLEWARE if not m.startswith('silk.')]
+    results = {}
+    with ExitStack() as stack:
+        # Profiling middleware and rate limits would distort (or block) the measurements
+        stack.enter_context(override_settings(MIDDLEWARE=middleware, ALLOWED_HOSTS=['*']))
+        stack.enter_context(mock.patch.object(APIView, 'check_throttles', lambda self, request: None))
+        for endpoint in build_endpoints():
+            if only and endpoint.name not in only:
+                continue
+            results[endpoint.name] = measure(endpoint, repeat, warm)
+    return results
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def over_budget(results, budgets):
+    """Return ``(endpoint, metric, value, budget)`` for every metric above its budget."""
+    violations = []
+    for name, metrics in results.items():
+        for metric, budget in budgets.get(name, {}).items():
+            if metrics.get(metric, 0) > budget:
+                violations.append((name, metric, metrics[metric], budget))
+    return violations
+
+
+def compare(results, previous, tolerance=0.1):
+    """
+    Return ``(endpoint, metric, before, after, change, regressed)`` rows; a metric
+    regresses when it grew by more than ``tolerance`` (a fraction) since ``previous``.
+    """
+    rows = []
+    for name, metrics in results.items():
+        before = previous.get(name)
+        if before is None:
+            continue
+        for metric in METRICS:
+            old, new = before.get(metric), metrics.get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else (1.0 if new else 0.0)
+            rows.append((name, metric, old, new, change, change > tolerance))
+    return rows
+
+
+def serializer_cases():
+    return {
+        'product': (ProductSerializer, Product.objects.select_related('category').order_by('pk')),
+        'order': (OrderSerializer, Order.objects.select_related('user').prefetch_related('items__product')
+                  .order_by('-created_at')),
+        'cart': (CartSerializer, Cart.objects.prefetch_related(
+            Prefetch('items', CartItem.objects.select_related('product'))).order_by('pk')),
+    }
+
+
+def best_of(func, repeat):
+    func()
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def serializer_costs(rows=500, repeat=5):
+    """
+    Per-object serialization cost in microseconds of the hot read serializers,
+    with plain DRF field handling and with the fast read path, for up to
+    ``rows`` objects of the current dataset (best of ``repeat`` runs).
+    """
+    context = {'request': Request(APIRequestFactory().get('/'))}
+    results = {}
+    for name, (serializer_class, queryset) in serializer_cases().items():
+        objects = list(queryset[:rows])
+        if not objects:
+            continue
+
+        def serialize():
+            return serializer_class(objects, many=True, context=context).data
+
+        costs = {}
+        for mode, enabled in (('drf', False), ('fast', True)):
+            with override_settings(FAST_READ_SERIALIZERS=enabled):
+                costs[f'{mode}_us'] = round(best_of(serialize, repeat) / len(objects) * 1e6, 2)
+        costs['speedup'] = round(costs['drf_us'] / costs['fast_us'], 2) if costs['fast_us'] else None
+        results[name] = {'objects': len(objects), **costs}
+    return results
+
+
+def renderer_costs(rows=500, repeat=5):
+    """
+    Time to render the serialized payload of ``rows`` objects with DRF's
+    JSONRenderer and with FastJSONRenderer, in milliseconds (best of
+    ``repeat`` runs), and whether both produced the same bytes.
+    """
+    context = {'request': Request(APIRequestFactory().get('/'))}
+    results = {}
+    for name, (serializer_class, queryset) in serializer_cases().items():
+        data = serializer_class(list(queryset[:rows]), many=True, context=context).data
+        if not data:
+            continue
+        expected, actual = JSONRenderer().render(data), FastJSONRenderer().render(data)
+        stdlib_ms = best_of(lambda: JSONRenderer().render(data), repeat) * 1000
+        fast_ms = best_of(lambda: FastJSONRenderer().render(data), repeat) * 1000
+        results[name] = {
+            'objects': len(data),
+            'bytes': len(expected),
+            'stdlib_ms': round(stdlib_ms, 2),
+            'fast_ms': round(fast_ms, 2),
+            'speedup': round(stdlib_ms / fast_ms, 2) if fast_ms else None,
+            'identical': actual == expected,
+        }
+    return results
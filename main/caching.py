@@ -0,0 +1,228 @@
+"""
+Generation-based (tagged) invalidation for cached views.
+
+Every cached entry records the current generation number of the tags it
+depends on. Invalidating a tag is a single INCR on its counter: entries
+built under an old generation are treated as stale and get rebuilt, so no
+key scanning is needed.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from rest_framework.response import Response
+
+from .metrics import CACHE_REQUESTS
+
+CATALOG = 'catalog'
+PRODUCT_LIST = 'product_list'
+ORDERS = 'orders'
+
+HIT, MISS, STALE = 'hit', 'miss', 'stale'
+CACHE_OUTCOMES = (HIT, MISS, STALE)
+CACHE_HEADER = 'X-Cache'
+
+
+def product_tag(pk):
+    return f'product:{pk}'
+
+
+def category_tag(slug):
+    return f'product_list:category:{slug}'
+
+
+def order_tag(user_id):
+    return f'orders:user:{user_id}'
+
+
+def _generation_key(tag):
+    return f'generation:{tag}'
+
+
+def get_generations(tags):
+    """Return ``{tag: generation}``, fetching all counters in one round trip."""
+    keys = {_generation_key(tag): tag for tag in tags}
+    found = cache.get_many(list(keys))
+    generations = {}
+    for key, tag in keys.items():
+        if key not in found:
+            # Seed with a timestamp so an evicted counter never reuses an old generation
+            cache.add(key, time.time_ns(), timeout=None)
+            found[key] = cache.get(key)
+        generations[tag] = found[key]
+    return generations
+
+
+def bump(*tags):
+    """Invalidate everything cached under the given tags."""
+    for tag in tags:
+        key = _generation_key(tag)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), timeout=None)
+
+
+def invalidate_products(product_ids, category_ids=()):
+    """
+    Invalidate the detail entries of the given products, the unscoped product
+    list and the list entries of every category they belong (or belonged) to,
+    including ancestor categories whose ``descendants=true`` listings cover them.
+
+    The bump is deferred until the surrounding transaction commits, so a
+    concurrent request can't re-cache the old rows under the new generation.
+    """
+    from .models import Category
+
+    product_ids = list(product_ids)
+    paths = Category.objects.filter(
+        Q(pk__in=list(category_ids)) | Q(products__pk__in=product_ids)
+    ).values_list('path', flat=True).distinct()
+    ancestor_ids = {int(pk) for path in paths for pk in path.strip('/').split('/') if pk}
+    categories = Category.objects.filter(pk__in=ancestor_ids).values_list('pk', 'slug') if ancestor_ids else []
+
+    tags = [PRODUCT_LIST]
+    tags += [product_tag(pk) for pk in product_ids]
+    # Listings can be scoped by either the category id or its slug
+    tags += [category_tag(key) for category in categories for key in category]
+    transaction.on_commit(lambda: bump(*tags))
+
+
+def invalidate_orders(user_ids):
+    """
+    Invalidate the cached order lists of the given users (and the staff-wide
+    listings) once the surrounding transaction commits.
+    """
+    tags = [ORDERS] + [order_tag(pk) for pk in set(user_ids)]
+    transaction.on_commit(lambda: bump(*tags))
+
+
+def product_list_tags(request, *args, **kwargs):
+    # Category-scoped listings only depend on products of that category (and its subtree)
+    category = request.GET.get('category') or request.GET.get('category_slug')
+    if category:
+        return [CATALOG, category_tag(category)]
+    return [CATALOG, PRODUCT_LIST]
+
+
+def product_detail_tags(request, *args, **kwargs):
+    return [CATALOG, product_tag(kwargs.get('pk'))]
+
+
+def product_info_tags(request, *args, **kwargs):
+    return [CATALOG, PRODUCT_LIST]
+
+
+def category_tree_tags(request, *args, **kwargs):
+    # Categories bump the catalog; any product write can change the counts
+    return [CATALOG, PRODUCT_LIST]
+
+
+def order_list_tags(request, *args, **kwargs):
+    # Staff list everyone's orders; customers only depend on their own version counter
+    if request.user.is_staff:
+        return [ORDERS, order_tag(request.user.pk)]
+    return [order_tag(request.user.pk)]
+
+
+def user_order_tags(request, *args, **kwargs):
+    return [order_tag(request.user.pk)]
+
+
+def record(key_prefix, outcome):
+    """Count a hit/miss/stale outcome for ``key_prefix`` in the shared cache and the process metrics."""
+    CACHE_REQUESTS.inc(cache=key_prefix, outcome=outcome)
+    key = f'cache_stats:{key_prefix}:{outcome}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+
+
+def get_stats(key_prefixes):
+    keys = {
+        f'cache_stats:{prefix}:{outcome}': (prefix, outcome)
+        for prefix in key_prefixes for outcome in CACHE_OUTCOMES
+    }
+    found = cache.get_many(list(keys))
+    stats = {prefix: dict.fromkeys(CACHE_OUTCOMES, 0) for prefix in key_prefixes}
+    for key, (prefix, outcome) in keys.items():
+        stats[prefix][outcome] = found.get(key, 0)
+    return stats
+
+
+def cache_response(key_prefix, tags, fresh_for, stale_for=60*5, lock_timeout=30, wait_for=2.0, per_user=False):
+    """
+    Cache the data of a DRF view, keyed on the full path, with stampede protection.
+    With ``per_user`` the key also includes the requesting user, for views
+    whose data depends on who is asking.
+
+    Each entry records the tag generations it was built under. An entry whose
+    generations are current and that is younger than ``fresh_for`` is a hit.
+    An older or invalidated entry is still served (for up to ``stale_for``
+    more seconds) while exactly one request, holding a short-lived lock,
+    recomputes it. On a cold miss, requests that lose the lock wait up to
+    ``wait_for`` seconds for the winner before computing it themselves.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapped(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view_func(request, *args, **kwargs)
+
+            generations = get_generations(tags(request, *args, **kwargs))
+            signature = [(tag, generations[tag]) for tag in sorted(generations)]
+            path_hash = hashlib.md5(request.get_full_path().encode()).hexdigest()
+            key = f'response:{key_prefix}:{path_hash}'
+            if per_user:
+                key = f'response:{key_prefix}:user:{request.user.pk}:{path_hash}'
+            lock_key = f'{key}:lock'
+
+            entry = cache.get(key)
+            if entry is not None and entry['signature'] == signature and entry['fresh_until'] > time.time():
+                return _cached(entry, key_prefix, HIT)
+
+            locked = cache.add(lock_key, 1, timeout=lock_timeout)
+            if not locked:
+                if entry is not None:
+                    return _cached(entry, key_prefix, STALE)
+                entry = _wait_for_entry(key, signature, wait_for)
+                if entry is not None:
+                    return _cached(entry, key_prefix, HIT)
+
+            try:
+                response = view_func(request, *args, **kwargs)
+                if response.status_code == 200:
+                    cache.set(key, {
+                        'signature': signature,
+                        'fresh_until': time.time() + fresh_for,
+                        'data': response.data,
+                    }, timeout=fresh_for + stale_for)
+            finally:
+                if locked:
+                    cache.delete(lock_key)
+
+            record(key_prefix, MISS)
+            response[CACHE_HEADER] = MISS.upper()
+            return response
+        return wrapped
+    return decorator
+
+
+def _cached(entry, key_prefix, outcome):
+    record(key_prefix, outcome)
+    return Response(entry['data'], headers={CACHE_HEADER: outcome.upper()})
+
+
+def _wait_for_entry(key, signature, wait_for, interval=0.05):
+    deadline = time.time() + wait_for
+    while time.time() < deadline:
+        time.sleep(interval)
+        entry = cache.get(key)
+        if entry is not None and entry['signature'] == signature:
+            return entry
+    return None
@@ -0,0 +1,174 @@
+"""
+Cart storage helpers.
+
+Anonymous clients get an ephemeral cart kept in the cache instead of the
+database: with the django_redis backend it is one Redis hash per cart
+(``product_id -> quantity``) that expires after ``CART_TTL`` seconds of
+inactivity. The client holds the cart token (``X-Cart-Token`` header or
+``cart_token`` cookie) and the cart is merged into the user's relational
+``Cart`` the first time an authenticated request presents it, so
+browse-and-abandon traffic never writes to the database.
+"""
+import re
+import secrets
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Cart, CartItem, Product
+
+CART_TOKEN_HEADER = 'X-Cart-Token'
+CART_TOKEN_COOKIE = 'cart_token'
+TOKEN_PATTERN = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+
+
+def session_carts_enabled():
+    return getattr(settings, 'ANONYMOUS_CARTS', False)
+
+
+def cart_ttl():
+    return getattr(settings, 'CART_TTL', 60 * 60 * 24 * 7)
+
+
+def get_cart_token(request):
+    """The cart token sent by the client, or ``None`` if missing or malformed."""
+    token = request.headers.get(CART_TOKEN_HEADER) or request.COOKIES.get(CART_TOKEN_COOKIE)
+    if token and TOKEN_PATTERN.match(token):
+        return token
+    return None
+
+
+def _redis():
+    """The raw Redis client behind the default cache, or ``None`` for other backends."""
+    try:
+        from django_redis import get_redis_connection
+    except ImportError:
+        return None
+    try:
+        return get_redis_connection('default')
+    except NotImplementedError:
+        return None
+
+
+class SessionCart:
+    """An anonymous cart stored in the cache under its token."""
+
+    def __init__(self, token=None):
+        self.token = token or secrets.token_urlsafe(24)
+        self.key = cache.make_key(f'cart:{self.token}')
+        self.redis = _redis()
+
+    def lines(self):
+        """Return ``{product_id: quantity}``."""
+        if self.redis is not None:
+            return {int(pk): int(quantity) for pk, quantity in self.redis.hgetall(self.key).items()}
+        return dict(cache.get(self.key, {}))
+
+    def add(self, product_id, quantity):
+        """Increase a line's quantity and return the new quantity."""
+        if self.redis is not None:
+            pipe = self.redis.pipeline()
+            pipe.hincrby(self.key, product_id, quantity)
+            pipe.expire(self.key, cart_ttl())
+            return pipe.execute()[0]
+        lines = self.lines()
+        lines[product_id] = lines.get(product_id, 0) + quantity
+        self._store(lines)
+        return lines[product_id]
+
+    def update(self, quantities):
+        """Set each product's quantity; a quantity of 0 removes the line."""
+        if self.redis is not None:
+            pipe = self.redis.pipeline()
+            removed = [pk for pk, quantity in quantities.items() if quantity <= 0]
+            kept = {pk: quantity for pk, quantity in quantities.items() if quantity > 0}
+            if removed:
+                pipe.hdel(self.key, *removed)
+            if kept:
+                pipe.hset(self.key, mapping=kept)
+            pipe.expire(self.key, cart_ttl())
+            pipe.execute()
+            return
+        lines = self.lines()
+        for pk, quantity in quantities.items():
+            if quantity > 0:
+                lines[pk] = quantity
+            else:
+                lines.pop(pk, None)
+        self._store(lines)
+
+    def remove(self, product_id):
+        """Drop a line, returning whether it was in the cart."""
+        if self.redis is not None:
+            return bool(self.redis.hdel(self.key, product_id))
+        lines = self.lines()
+        found = lines.pop(product_id, None) is not None
+        self._store(lines)
+        return found
+
+    def clear(self):
+        if self.redis is not None:
+            self.redis.delete(self.key)
+        else:
+            cache.delete(self.key)
+
+    def _store(self, lines):
+        if lines:
+            cache.set(self.key, lines, timeout=cart_ttl())
+        else:
+            cache.delete(self.key)
+
+
+def apply_cart_lines(cart, quantities):
+    """
+    Set the quantity of each ``{product: quantity}`` line in a relational cart
+    (0 removes it) with at most one delete, one bulk_update and one bulk_create.
+    """
+    with transaction.atomic():
+        existing = {item.product_id: item for item in cart.items.all()}
+        removed, changed, added = [], [], []
+        for product, quantity in quantities.items():
+            item = existing.get(product.pk)
+            if quantity <= 0:
+                if item is not None:
+                    removed.append(product.pk)
+            elif item is None:
+                added.append(CartItem(cart=cart, product=product, quantity=quantity))
+            elif item.quantity != quantity:
+                item.quantity = quantity
+                changed.append(item)
+
+        if removed:
+            cart.items.filter(product_id__in=removed).delete()
+        if changed:
+            CartItem.objects.bulk_update(changed, ['quantity'])
+        if added:
+            CartItem.objects.bulk_create(added)
+    return cart
+
+
+def merge_session_cart(token, user):
+    """
+    Fold an anonymous cart into the user's relational cart and delete it.
+
+    Quantities are added to any existing lines and capped at the available
+    stock; inactive or deleted products are dropped.
+    """
+    session_cart = SessionCart(token)
+    lines = session_cart.lines()
+    if not lines:
+        return None
+
+    with transaction.atomic():
+        cart, created = Cart.objects.get_or_create(user=user)
+        existing = dict(cart.items.values_list('product_id', 'quantity'))
+        merged = {}
+        for product in Product.objects.filter(pk__in=list(lines), is_active=True):
+            current = existing.get(product.pk, 0)
+            quantity = min(current + lines[product.pk], product.available_stock)
+            if quantity > current:
+                merged[product] = quantity
+        apply_cart_lines(cart, merged)
+        transaction.on_commit(session_cart.clear)
+    return cart
@@ -0,0 +1,104 @@
+"""
+Conditional GET (``ETag`` / ``Last-Modified``) for read endpoints.
+
+Validators are computed from version data that is cheap to read: the tag
+generations of the tagged cache (bumped on every write that affects a
+payload) and single-row ``updated_at`` lookups. When the client's
+``If-None-Match`` / ``If-Modified-Since`` still match, the view is skipped
+entirely and a 304 is returned without touching the serializer.
+"""
+import hashlib
+from functools import wraps
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .caching import (
+    CACHE_HEADER, STALE, category_tree_tags, get_generations, product_detail_tags, product_list_tags,
+)
+from .models import CartItem, Order, OrderItem, Product
+
+
+def make_etag(request, *parts):
+    """Hash ``parts`` together with the URL and the negotiated format into a strong ETag."""
+    renderer = getattr(request, 'accepted_renderer', None)
+    raw = repr([request.get_full_path(), getattr(renderer, 'format', None), *parts])
+    return quote_etag(hashlib.md5(raw.encode()).hexdigest())
+
+
+def conditional(validators):
+    """
+    Answer conditional GETs on a DRF view method.
+
+    ``validators(request, *args, **kwargs)`` returns ``(etag, last_modified)``
+    (either may be ``None``), or ``None`` when the resource can't be
+    validated, e.g. because it doesn't exist and the view will 404.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapped(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view_func(request, *args, **kwargs)
+            etag, last_modified = validators(request, *args, **kwargs) or (None, None)
+            timestamp = int(last_modified.timestamp()) if last_modified else None
+
+            response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if response is not None:
+                return response
+
+            response = view_func(request, *args, **kwargs)
+            # A stale cached body predates the current version, so it must not carry its validators
+            if response.status_code == 200 and response.get(CACHE_HEADER) != STALE.upper():
+                if etag:
+                    response['ETag'] = etag
+                if timestamp:
+                    response['Last-Modified'] = http_date(timestamp)
+            return response
+        return wrapped
+    return decorator
+
+
+def generation_validators(tags):
+    """Validators from the generations of the view's cache tags, without a database query."""
+    def validators(request, *args, **kwargs):
+        generations = get_generations(tags(request, *args, **kwargs))
+        return make_etag(request, sorted(generations.items())), None
+    return validators
+
+
+product_list_validators = generation_validators(product_list_tags)
+category_validators = generation_validators(category_tree_tags)
+
+
+def product_detail_validators(request, *args, **kwargs):
+    updated_at = Product.objects.filter(pk=kwargs.get('pk')).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return None
+    # Category renames reach the payload without touching the product row
+    generations = get_generations(product_detail_tags(request, *args, **kwargs))
+    return make_etag(request, updated_at, sorted(generations.items())), updated_at
+
+
+def order_validators(request, *args, **kwargs):
+    orders = Order.objects.filter(pk=kwargs.get('pk'))
+    if not request.user.is_staff:
+        orders = orders.filter(user=request.user)
+    # The payload also shows product names and (with ?expand=user) the owner's details
+    row = orders.values_list('updated_at', 'user__username', 'user__email').first()
+    if row is None:
+        return None
+    products = OrderItem.objects.filter(order_id=kwargs.get('pk')).order_by('pk').values_list(
+        'pk', 'product__updated_at'
+    )
+    updated_at = max([row[0], *(product_updated_at for _, product_updated_at in products)])
+    return make_etag(request, row, list(products)), updated_at
+
+
+def cart_validators(request, *args, **kwargs):
+    # Item edits don't touch the cart row, so hash the lines (and their products' versions) instead
+    if not request.user.is_authenticated:
+        return None
+    lines = CartItem.objects.filter(cart__user=request.user).order_by('pk').values_list(
+        'pk', 'quantity', 'product__updated_at'
+    )
+    return make_etag(request, request.user.pk, list(lines)), None
@@ -2,23 +2,42 @@ import django_filters
 from django_filters.rest_framework import FilterSet
 from rest_framework import filters
 
-from .models import Order, Product
+from .models import Category, Order, Product
 
 
 class ProductFilter(django_filters.FilterSet):
     min_price = django_filters.NumberFilter(field_name='price', lookup_expr='gte')
     max_price = django_filters.NumberFilter(field_name='price', lookup_expr='lte')
-    category_slug = django_filters.CharFilter(field_name='category__slug', lookup_expr='exact')
+    category = django_filters.CharFilter(method='filter_category')
+    category_slug = django_filters.CharFilter(method='filter_category')
+    descendants = django_filters.BooleanFilter(method='filter_descendants')
     in_stock = django_filters.BooleanFilter(method='filter_in_stock')
     
     class Meta:
         model = Product
         fields = {
             'name': ['iexact', 'icontains'],
-            'category': ['exact'],
             'is_active': ['exact'],
         }
     
+    def filter_category(self, queryset, name, value):
+        """Filter by category id or slug; with ``descendants=true`` the whole subtree matches."""
+        # Resolve the category up front so the product query compares against constants its indexes can serve
+        lookup = {'pk': value} if value.isdigit() else {'slug': value}
+        category = Category.objects.filter(**lookup).values_list('pk', 'path').first()
+        if category is None:
+            return queryset.none()
+        pk, path = category
+        if self.form.cleaned_data.get('descendants'):
+            # One prefix match on the materialized path finds the subtree, whatever the tree depth
+            subtree = Category.objects.filter(path__startswith=path).values_list('pk', flat=True)
+            return queryset.filter(category__in=list(subtree))
+        return queryset.filter(category=pk)
+    
+    def filter_descendants(self, queryset, name, value):
+        # Consumed by filter_category
+        return queryset
+    
     def filter_in_stock(self, queryset, name, value):
         if value:
             return queryset.filter(stock__gt=0)
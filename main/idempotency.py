@@ -0,0 +1,186 @@
+"""
+Idempotency-Key support for endpoints with side effects.
+
+The first request carrying a given key claims it; once it succeeds its
+response is stored for ``IDEMPOTENCY_TTL`` seconds and retries with the same
+key get that response back (marked with ``Idempotent-Replayed: true``)
+without running the view again. Records live in the cache (Redis) and fall
+back to the ``IdempotencyRecord`` table when the cache is unreachable, or
+always when ``IDEMPOTENCY_STORE = 'db'``. Keys are scoped to the user, or for
+anonymous clients to their cart token, which they must send along with the key.
+
+Failed requests (exceptions and non-2xx responses) release their claim:
+their transaction was rolled back, so the client may retry with the same key.
+"""
+import hashlib
+import json
+import logging
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.utils import encoders
+
+from .carts import CART_TOKEN_HEADER, get_cart_token
+from .exceptions import IdempotencyKeyInUse, IdempotencyKeyReused
+from .models import IdempotencyRecord
+
+try:
+    from redis.exceptions import RedisError
+except ImportError:
+    CACHE_ERRORS = (ConnectionError,)
+else:
+    CACHE_ERRORS = (ConnectionError, RedisError)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+logger = logging.getLogger(__name__)
+
+
+def idempotency_ttl():
+    return getattr(settings, 'IDEMPOTENCY_TTL', 60 * 60 * 24)
+
+
+class CacheStore:
+    def cache_key(self, key):
+        return f'idempotency:{key}'
+
+    def claim(self, key, fingerprint):
+        return cache.add(self.cache_key(key), {'fingerprint': fingerprint, 'status': None}, timeout=idempotency_ttl())
+
+    def get(self, key):
+        return cache.get(self.cache_key(key))
+
+    def save(self, key, fingerprint, status_code, data):
+        entry = {'fingerprint': fingerprint, 'status': status_code, 'data': data}
+        cache.set(self.cache_key(key), entry, timeout=idempotency_ttl())
+
+    def release(self, key):
+        cache.delete(self.cache_key(key))
+
+
+class DatabaseStore:
+    def cutoff(self):
+        return timezone.now() - timedelta(seconds=idempotency_ttl())
+
+    def claim(self, key, fingerprint):
+        IdempotencyRecord.objects.filter(key=key, created_at__lt=self.cutoff()).delete()
+        try:
+            with transaction.atomic():
+                IdempotencyRecord.objects.create(key=key, fingerprint=fingerprint)
+        except IntegrityError:
+            return False
+        return True
+
+    def get(self, key):
+        record = IdempotencyRecord.objects.filter(key=key, created_at__gte=self.cutoff()).first()
+        if record is None:
+            return None
+        return {'fingerprint': record.fingerprint, 'status': record.status_code, 'data': record.response_data}
+
+    def save(self, key, fingerprint, status_code, data):
+        # Round-trip through DRF's encoder so replays render exactly like the original (e.g. Decimal as a number)
+        data = json.loads(json.dumps(data, cls=encoders.JSONEncoder))
+        IdempotencyRecord.objects.filter(key=key).update(status_code=status_code, response_data=data)
+
+    def release(self, key):
+        IdempotencyRecord.objects.filter(key=key).delete()
+
+
+cache_store = CacheStore()
+database_store = DatabaseStore()
+
+
+def purge_expired():
+    """Delete database records older than the TTL and return how many were removed."""
+    deleted, _ = IdempotencyRecord.objects.filter(created_at__lt=database_store.cutoff()).delete()
+    return deleted
+
+
+def _record_key(request, scope, idempotency_key):
+    # Keys are only unique per client, so scope them to the user (or anonymous cart)
+    if request.user.is_authenticated:
+        owner = f'user:{request.user.pk}'
+    else:
+        token = get_cart_token(request)
+        if token is None:
+            # Every tokenless client would share one namespace and could replay each other's responses
+            raise ValidationError({
+                IDEMPOTENCY_HEADER: f'Anonymous requests need an {CART_TOKEN_HEADER} to use an idempotency key.'
+            })
+        owner = f'cart:{token}'
+    raw = f'{scope}:{owner}:{idempotency_key}'
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _fingerprint(request):
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    payload = json.dumps([request.method, request.path, data], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _claim(key, fingerprint):
+    """Claim ``key`` and return ``(store, claimed)``, using the database if the cache is down."""
+    if getattr(settings, 'IDEMPOTENCY_STORE', 'cache') == 'cache':
+        try:
+            return cache_store, cache_store.claim(key, fingerprint)
+        except CACHE_ERRORS:
+            logger.warning('Idempotency cache unavailable, falling back to the database', exc_info=True)
+    return database_store, database_store.claim(key, fingerprint)
+
+
+def idempotent(scope):
+    """
+    Honour the ``Idempotency-Key`` header on a DRF view method.
+
+    ``scope`` names the endpoint so the same key sent to two different
+    endpoints doesn't collide.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapped(request, *args, **kwargs):
+            idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+            if not idempotency_key:
+                return view_func(request, *args, **kwargs)
+            if len(idempotency_key) > 255:
+                raise ValidationError({IDEMPOTENCY_HEADER: 'Must be at most 255 characters.'})
+
+            key = _record_key(request, scope, idempotency_key)
+            fingerprint = _fingerprint(request)
+            store, claimed = _claim(key, fingerprint)
+
+            if not claimed:
+                entry = store.get(key)
+                if entry is None:
+                    # The earlier attempt failed or expired in the meantime
+                    claimed = store.claim(key, fingerprint)
+                    if not claimed:
+                        raise IdempotencyKeyInUse()
+                elif entry['fingerprint'] != fingerprint:
+                    raise IdempotencyKeyReused()
+                elif entry['status'] is None:
+                    raise IdempotencyKeyInUse()
+                else:
+                    return Response(entry['data'], status=entry['status'], headers={REPLAYED_HEADER: 'true'})
+
+            try:
+                response = view_func(request, *args, **kwargs)
+            except Exception:
+                store.release(key)
+                raise
+
+            if 200 <= response.status_code < 300:
+                store.save(key, fingerprint, response.status_code, response.data)
+            else:
+                store.release(key)
+            return response
+        return wrapped
+    return decorator
@@ -0,0 +1,158 @@
+"""
+Stock reservation primitives built on conditional F() expression updates.
+
+Each operation touches every product of an order in one UPDATE, with the
+per-product quantity supplied through a CASE expression, so an order costs
+the same number of round trips no matter how many lines it has.
+
+Before that UPDATE the rows are locked with ``SELECT ... FOR UPDATE`` in
+primary key order, so concurrent multi-item orders take row locks in the same
+sequence and cannot deadlock (a multi-row UPDATE locks rows in whatever order
+the database scans them).
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .caching import invalidate_orders, invalidate_products
+from .exceptions import InsufficientStock
+from .models import Order, OrderItem, Product
+
+
+def quantities_by_product(items):
+    """Collapse ``(product_id, quantity)`` pairs into a ``{product_id: quantity}`` mapping."""
+    quantities = Counter()
+    for product_id, quantity in items:
+        quantities[product_id] += quantity
+    return quantities
+
+
+def per_product(quantities):
+    """CASE expression mapping each product pk to its quantity."""
+    return Case(
+        *[When(pk=product_id, then=Value(quantities[product_id])) for product_id in sorted(quantities)],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def lock_products(quantities):
+    """Lock the rows of ``quantities`` in primary key order; call inside a transaction."""
+    list(Product.objects.select_for_update().filter(pk__in=list(quantities)).order_by('pk').values_list('pk'))
+
+
+def reserve_stock(quantities):
+    """
+    Reserve stock for each product, failing atomically if any product cannot cover it.
+
+    The guard ``reserved_stock + quantity <= stock`` is evaluated by the database
+    inside the UPDATE itself, so a row that lost a race simply isn't matched and
+    the affected row count comes back short.
+    """
+    if not quantities:
+        return
+
+    try:
+        with transaction.atomic():
+            lock_products(quantities)
+            quantity = per_product(quantities)
+            reserved = Product.objects.filter(
+                pk__in=list(quantities),
+                reserved_stock__lte=F('stock') - quantity,
+            ).update(
+                reserved_stock=F('reserved_stock') + quantity,
+                updated_at=timezone.now(),
+            )
+            if reserved != len(quantities):
+                raise InsufficientStock()
+    except InsufficientStock:
+        # The savepoint is rolled back, so the counters read here are the real ones
+        raise InsufficientStock(_insufficient_stock_message(quantities))
+
+    invalidate_products(quantities)
+
+
+def release_stock(quantities):
+    """Return previously reserved units to the available pool."""
+    if not quantities:
+        return
+
+    with transaction.atomic():
+        lock_products(quantities)
+        quantity = per_product(quantities)
+        Product.objects.filter(pk__in=list(quantities)).update(
+            reserved_stock=Greatest(F('reserved_stock') - quantity, 0),
+            updated_at=timezone.now(),
+        )
+    invalidate_products(quantities)
+
+
+def consume_stock(quantities):
+    """Deduct delivered units from both the physical and the reserved stock."""
+    if not quantities:
+        return
+
+    with transaction.atomic():
+        lock_products(quantities)
+        quantity = per_product(quantities)
+        Product.objects.filter(pk__in=list(quantities)).update(
+            stock=Greatest(F('stock') - quantity, 0),
+            reserved_stock=Greatest(F('reserved_stock') - quantity, 0),
+            updated_at=timezone.now(),
+        )
+    invalidate_products(quantities)
+
+
+def release_expired_reservations(hold_for, batch_size=500):
+    """
+    Cancel Pending orders created more than ``hold_for`` ago and release their stock.
+
+    Works in batches, each its own transaction: one indexed
+    ``(status, created_at)`` scan picks the batch (skipping rows another
+    transaction has locked, e.g. an order being confirmed), one UPDATE cancels
+    it and one CASE UPDATE returns the reserved units. Returns
+    ``(cancelled_orders, released_units)``.
+    """
+    cutoff = timezone.now() - hold_for
+    cancelled_orders = released_units = 0
+
+    while True:
+        with transaction.atomic():
+            batch = list(
+                Order.objects.select_for_update(skip_locked=True)
+                .filter(status=Order.StatusChoices.PENDING, created_at__lt=cutoff)
+                .order_by('created_at')
+                .values_list('pk', 'user_id')[:batch_size]
+            )
+            if not batch:
+                break
+            order_ids = [pk for pk, _ in batch]
+
+            Order.objects.filter(pk__in=order_ids).update(
+                status=Order.StatusChoices.CANCELLED,
+                updated_at=timezone.now(),
+            )
+            quantities = quantities_by_product(
+                OrderItem.objects.filter(order_id__in=order_ids).values_list('product_id', 'quantity')
+            )
+            release_stock(quantities)
+            # The bulk UPDATE skips the Order signals, so invalidate the owners' order lists here
+            invalidate_orders(user_id for _, user_id in batch)
+
+        cancelled_orders += len(order_ids)
+        released_units += sum(quantities.values())
+        if len(order_ids) < batch_size:
+            break
+
+    return cancelled_orders, released_units
+
+
+def _insufficient_stock_message(quantities):
+    products = Product.objects.filter(pk__in=list(quantities)).only('name', 'stock', 'reserved_stock')
+    for product in products:
+        if quantities[product.pk] > product.available_stock:
+            return f"Only {product.available_stock} units of {product.name} available."
+    return 'One or more products are no longer available.'
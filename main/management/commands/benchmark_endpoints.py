@@ -0,0 +1,58 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks every API endpoint against the current database: p50/p95 latency, query count and '
+        'response bytes, checked against the budgets in main/benchmark_budgets.json'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help='Requests per endpoint')
+        parser.add_argument('--warm', action='store_true', help='Let the product caches serve repeated requests')
+        parser.add_argument('--only', nargs='+', help='Benchmark only these endpoints')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+        parser.add_argument('--compare', help='Report changes against the results JSON of a previous run')
+        parser.add_argument('--tolerance', type=float, default=0.1, help='Allowed growth before a change is flagged')
+        parser.add_argument('--budgets', default=str(benchmarks.BUDGETS_PATH))
+        parser.add_argument('--check', action='store_true', help='Exit with an error if any budget is exceeded')
+
+    def handle(self, *args, **options):
+        try:
+            results = benchmarks.run(options['repeat'], options['warm'], options['only'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(f"{'endpoint':<24} {'status':>8} {'p50 ms':>9} {'p95 ms':>9} {'queries':>8} {'bytes':>10}")
+        for name, metrics in results.items():
+            status = ','.join(str(code) for code in metrics['status'])
+            self.stdout.write(
+                f"{name:<24} {status:>8} {metrics['p50_ms']:>9.2f} {metrics['p95_ms']:>9.2f} "
+                f"{metrics['queries']:>8} {metrics['bytes']:>10}"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if options['compare']:
+            self.report_changes(results, benchmarks.load(options['compare']), options['tolerance'])
+
+        violations = benchmarks.over_budget(results, benchmarks.load(options['budgets']))
+        for name, metric, value, budget in violations:
+            self.stdout.write(self.style.ERROR(f'Over budget: {name} {metric} = {value} (budget {budget})'))
+        if not violations:
+            self.stdout.write(self.style.SUCCESS('All endpoints within budget.'))
+        elif options['check']:
+            raise CommandError(f'{len(violations)} budget(s) exceeded.')
+
+    def report_changes(self, results, previous, tolerance):
+        self.stdout.write(f"\n{'endpoint':<24} {'metric':<8} {'before':>10} {'after':>10} {'change':>8}")
+        for name, metric, before, after, change, regressed in benchmarks.compare(results, previous, tolerance):
+            line = f'{name:<24} {metric:<8} {before:>10} {after:>10} {change:>+8.1%}'
+            self.stdout.write(self.style.ERROR(line) if regressed else line)
@@ -0,0 +1,50 @@
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from main.models import Product, User
+from main.serializers import OrderCreateSerializer
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks order creation: query count and latency versus number of order lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, nargs='+', default=[1, 5, 10, 25, 50])
+        parser.add_argument('--repeat', type=int, default=5, help='Orders created per line count')
+
+    def handle(self, *args, **options):
+        lines, repeat = options['lines'], options['repeat']
+
+        # Everything runs in a transaction that is rolled back, leaving the database untouched
+        with transaction.atomic():
+            user = User.objects.create_user(username=f'benchmark-{uuid.uuid4().hex[:12]}')
+            products = Product.objects.bulk_create([
+                Product(name=f'Benchmark product {i}', description='', price=10, stock=10 ** 6)
+                for i in range(max(lines))
+            ])
+
+            self.stdout.write(f"{'lines':>6} {'queries':>8} {'median ms':>10} {'max ms':>8}")
+            for line_count in lines:
+                payload = {
+                    'items': [{'product': product.pk, 'quantity': 1} for product in products[:line_count]]
+                }
+                timings = []
+                for _ in range(repeat):
+                    with CaptureQueriesContext(connection) as queries:
+                        start = time.perf_counter()
+                        serializer = OrderCreateSerializer(data=payload)
+                        serializer.is_valid(raise_exception=True)
+                        serializer.save(user=user)
+                        timings.append((time.perf_counter() - start) * 1000)
+
+                self.stdout.write(
+                    f'{line_count:>6} {len(queries.captured_queries):>8} '
+                    f'{statistics.median(timings):>10.2f} {max(timings):>8.2f}'
+                )
+
+            transaction.set_rollback(True)
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from main import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures the per-object cost of the product, order and cart serializers (plain DRF versus the fast '
+        'read path) and the time to render their payloads (stdlib JSON versus orjson)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=500, help='Objects serialized per run')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per mode; the best one is reported')
+
+    def handle(self, *args, **options):
+        results = benchmarks.serializer_costs(options['rows'], options['repeat'])
+        if not results:
+            self.stdout.write('Nothing to serialize; run seed_data first.')
+            return
+
+        self.stdout.write(f"{'serializer':<12} {'objects':>8} {'drf us/obj':>11} {'fast us/obj':>12} {'speedup':>8}")
+        for name, costs in results.items():
+            self.stdout.write(
+                f"{name:<12} {costs['objects']:>8} {costs['drf_us']:>11.2f} {costs['fast_us']:>12.2f} "
+                f"{costs['speedup']:>7.2f}x"
+            )
+
+        self.stdout.write(
+            f"\n{'renderer':<12} {'objects':>8} {'bytes':>10} {'stdlib ms':>10} {'fast ms':>8} {'speedup':>8}"
+        )
+        for name, costs in benchmarks.renderer_costs(options['rows'], options['repeat']).items():
+            line = (
+                f"{name:<12} {costs['objects']:>8} {costs['bytes']:>10} {costs['stdlib_ms']:>10.2f} "
+                f"{costs['fast_ms']:>8.2f} {costs['speedup']:>7.2f}x"
+            )
+            self.stdout.write(line if costs['identical'] else self.style.ERROR(f'{line}  output differs'))
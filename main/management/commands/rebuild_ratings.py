@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from main.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the denormalized rating_sum, rating_count and average_rating columns on Product'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10000,
+            help='Number of products updated per statement (by primary key range)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        bounds = Product.objects.order_by('pk').values_list('pk', flat=True)
+        first, last = bounds.first(), bounds.last()
+        if first is None:
+            self.stdout.write('No products to rebuild.')
+            return
+
+        updated = 0
+        for start in range(first, last + 1, batch_size):
+            updated += Product.objects.filter(
+                pk__gte=start, pk__lt=start + batch_size
+            ).rebuild_rating_aggregates()
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rating aggregates for {updated} products.'))
@@ -1,8 +1,20 @@
+import itertools
 import random
+import time
+import uuid
+from array import array
+from bisect import bisect
+from contextlib import contextmanager
+from datetime import timedelta
 from decimal import Decimal
 
-from django.core.management.base import BaseCommand
-from django.utils import lorem_ipsum
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import lorem_ipsum, timezone
 from django.utils.text import slugify
 
 from main.models import (
@@ -10,11 +22,64 @@ from main.models import (
     Category, Review, Cart, CartItem
 )
 
+ADJECTIVES = (
+    'Compact', 'Classic', 'Wireless', 'Premium', 'Portable', 'Smart', 'Vintage', 'Ergonomic',
+    'Deluxe', 'Eco', 'Ultra', 'Mini', 'Pro', 'Rugged', 'Silent', 'Modular',
+)
+NOUNS = (
+    'Camera', 'Headphones', 'Blender', 'Backpack', 'Lamp', 'Keyboard', 'Novel', 'Jacket',
+    'Speaker', 'Kettle', 'Monitor', 'Sneakers', 'Guitar', 'Watch', 'Desk', 'Notebook',
+)
+CATEGORY_NAMES = (
+    'Electronics', 'Books', 'Music', 'Home & Kitchen', 'Fashion', 'Sports', 'Toys', 'Garden',
+    'Audio', 'Cameras', 'Computers', 'Fiction', 'Cookware', 'Shoes', 'Outdoor', 'Office',
+)
+WORDS = lorem_ipsum.WORDS
+
+# Reviews skew positive, with a bump of one-star complaints
+RATING_WEIGHTS = ((1, 10), (2, 5), (3, 10), (4, 25), (5, 50))
+# Older orders have mostly run their course; recent ones are still in flight
+SETTLED_STATUSES = (('Delivered', 85), ('Cancelled', 15))
+OPEN_STATUSES = (('Pending', 30), ('Confirmed', 25), ('Processing', 20), ('Shipped', 25))
+# Statuses whose units are still held in reserved_stock
+RESERVING_STATUSES = ('Pending', 'Confirmed', 'Processing', 'Shipped')
+
+
+@contextmanager
+def backdated(*fields):
+    """Let bulk_create write explicit values into auto_now_add fields."""
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
 
 class Command(BaseCommand):
-    help = 'Creates application data with sample products, categories, reviews, and orders'
+    help = (
+        'Creates application data with sample products, categories, reviews, and orders. '
+        'Pass --products/--users/--orders to generate a large synthetic dataset for load testing instead.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, help='Number of synthetic products to generate')
+        parser.add_argument('--users', type=int, help='Number of synthetic users to generate')
+        parser.add_argument('--orders', type=int, help='Number of synthetic orders to generate')
+        parser.add_argument('--reviews', type=int, help='Number of synthetic reviews (default: one per two orders)')
+        parser.add_argument('--categories', type=int, default=60, help='Size of the synthetic category tree')
+        parser.add_argument('--days', type=int, default=365, help='Spread order dates over this many past days')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed; the same seed yields the same data')
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Rows per bulk_create batch')
 
-    def handle(self, *args, **kwargs):
+    def handle(self, *args, **options):
+        if any(options[name] for name in ('products', 'users', 'orders', 'reviews')):
+            self.seed_at_scale(options)
+        else:
+            self.seed_sample()
+
+    def seed_sample(self):
         self.stdout.write(self.style.SUCCESS('Starting to seed data...'))
         
         # Get or create superuser
@@ -180,3 +245,174 @@ class Command(BaseCommand):
         self.stdout.write('  Admin: username=admin, password=test')
         self.stdout.write('  User1: username=john_doe, password=password123')
         self.stdout.write('  User2: username=jane_smith, password=password123')
+
+    def seed_at_scale(self, options):
+        self.rng = random.Random(options['seed'])
+        self.chunk_size = options['chunk_size']
+        self.prefix = f"load{options['seed']}"
+        if not connection.features.can_return_rows_from_bulk_insert:
+            raise CommandError('Large-scale seeding needs a database that returns primary keys from bulk inserts.')
+        if User.objects.filter(username=f'{self.prefix}-0').exists():
+            raise CommandError(f"Data for --seed {options['seed']} already exists; pick another seed.")
+
+        product_count = options['products'] or 1000
+        user_count = options['users'] or 100
+        order_count = options['orders'] or 0
+        review_count = options['reviews'] if options['reviews'] is not None else order_count // 2
+
+        started = time.perf_counter()
+        category_ids = self.create_category_tree(options['categories'])
+        user_ids = self.create_users(user_count)
+        product_ids, prices = self.create_products(product_count, category_ids)
+
+        # Zipf-like popularity: a small share of products gets most of the orders and reviews
+        self.popular = list(product_ids)
+        self.rng.shuffle(self.popular)
+        self.popularity = list(itertools.accumulate(1 / (rank + 1) ** 0.9 for rank in range(len(self.popular))))
+        self.prices = dict(zip(product_ids, prices)) if order_count else {}
+
+        self.create_reviews(review_count, user_ids)
+        self.create_orders(order_count, user_ids, options['days'])
+
+        self.stdout.write('Reconciling reserved stock and rating aggregates...')
+        self.reconcile_reserved_stock(product_ids)
+        call_command('rebuild_ratings', batch_size=self.chunk_size, stdout=self.stdout)
+        if connection.vendor in ('postgresql', 'sqlite'):
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {len(category_ids)} categories, {user_count} users, {product_count} products, '
+            f'{order_count} orders and ~{review_count} reviews in {time.perf_counter() - started:.1f}s'
+        ))
+
+    def pick_product(self):
+        return self.popular[bisect(self.popularity, self.rng.random() * self.popularity[-1])]
+
+    def weighted(self, choices):
+        values, weights = zip(*choices)
+        return self.rng.choices(values, weights)[0]
+
+    def bulk_insert(self, model, total, build, label, **kwargs):
+        """bulk_create ``total`` rows from ``build(index)`` in chunks, one transaction each; returns the pks."""
+        pks = array('q')
+        for start in range(0, total, self.chunk_size):
+            stop = min(start + self.chunk_size, total)
+            with transaction.atomic():
+                created = model.objects.bulk_create([build(i) for i in range(start, stop)], **kwargs)
+            if created and created[0].pk is not None:
+                pks.extend(obj.pk for obj in created)
+            self.stdout.write(f'  {label}: {stop}/{total}')
+        return pks
+
+    def create_category_tree(self, count):
+        self.stdout.write('Creating category tree...')
+        category_ids = []
+        # Few categories, so save() runs per row and maintains the materialized paths
+        for i in range(count):
+            name = f'{CATEGORY_NAMES[i % len(CATEGORY_NAMES)]} {i} ({self.prefix})'
+            parent_id = self.rng.choice(category_ids) if i >= len(CATEGORY_NAMES) else None
+            category = Category.objects.create(
+                name=name, slug=slugify(name), parent_id=parent_id
+            )
+            category_ids.append(category.pk)
+        return category_ids
+
+    def create_users(self, count):
+        self.stdout.write('Creating users...')
+        password = make_password('password123')
+        user_ids = self.bulk_insert(User, count, lambda i: User(
+            username=f'{self.prefix}-{i}', email=f'{self.prefix}-{i}@example.com', password=password,
+        ), 'users')
+        # bulk_create skips the post_save signal that normally creates the profile
+        cities = ('New York', 'Cairo', 'Berlin', 'Tokyo', 'Lagos', 'Lima', 'Toronto', 'Sydney')
+        self.bulk_insert(UserProfile, count, lambda i: UserProfile(
+            user_id=user_ids[i],
+            shipping_address_line1=f'{self.rng.randint(1, 9999)} Main St',
+            shipping_city=self.rng.choice(cities),
+            shipping_postal_code=f'{self.rng.randint(10000, 99999)}',
+            shipping_country='USA',
+        ), 'profiles')
+        return user_ids
+
+    def create_products(self, count, category_ids):
+        self.stdout.write('Creating products...')
+        prices = array('q')
+
+        def build(i):
+            # Log-normal prices: most items are cheap, a long tail is expensive
+            cents = min(int(self.rng.lognormvariate(3.3, 1.1) * 100) + 99, 999999)
+            prices.append(cents)
+            return Product(
+                name=f'{self.rng.choice(ADJECTIVES)} {self.rng.choice(NOUNS)} {i}',
+                description=' '.join(self.rng.choices(WORDS, k=self.rng.randint(8, 30))),
+                price=Decimal(cents) / 100,
+                stock=0 if self.rng.random() < 0.05 else self.rng.randint(1, 500),
+                category_id=self.rng.choice(category_ids),
+                is_active=self.rng.random() < 0.95,
+            )
+
+        product_ids = self.bulk_insert(Product, count, build, 'products')
+        return product_ids, prices
+
+    def create_reviews(self, count, user_ids):
+        if not count:
+            return
+        self.stdout.write('Creating reviews...')
+        titles = ('Great product!', 'Good value', 'Excellent', 'Not bad', 'Disappointing', 'Amazing quality')
+        # Duplicate (product, user) pairs are dropped, so the final count can come in slightly lower
+        self.bulk_insert(Review, count, lambda i: Review(
+            product_id=self.pick_product(),
+            user_id=self.rng.choice(user_ids),
+            rating=self.weighted(RATING_WEIGHTS),
+            title=self.rng.choice(titles),
+            comment=' '.join(self.rng.choices(WORDS, k=self.rng.randint(5, 25))),
+        ), 'reviews', ignore_conflicts=True)
+
+    def create_orders(self, count, user_ids, days):
+        if not count:
+            return
+        self.stdout.write('Creating orders...')
+        now = timezone.now()
+        created_at = Order._meta.get_field('created_at')
+
+        for start in range(0, count, self.chunk_size):
+            stop = min(start + self.chunk_size, count)
+            orders, items = [], []
+            for _ in range(start, stop):
+                age = timedelta(seconds=self.rng.random() * days * 86400)
+                order = Order(
+                    order_id=uuid.UUID(int=self.rng.getrandbits(128), version=4),
+                    user_id=self.rng.choice(user_ids),
+                    status=self.weighted(SETTLED_STATUSES if age > timedelta(days=14) else OPEN_STATUSES),
+                    created_at=now - age,
+                    shipping_address_line1='123 Main St',
+                    shipping_city='New York',
+                    shipping_country='USA',
+                )
+                orders.append(order)
+                for product_id in {self.pick_product() for _ in range(self.weighted(((1, 50), (2, 25), (3, 15), (5, 10))))}:
+                    items.append(OrderItem(
+                        order_id=order.order_id,
+                        product_id=product_id,
+                        quantity=self.weighted(((1, 80), (2, 15), (3, 5))),
+                        price_at_purchase=Decimal(self.prices[product_id]) / 100,
+                    ))
+            with transaction.atomic(), backdated(created_at):
+                Order.objects.bulk_create(orders)
+                OrderItem.objects.bulk_create(items, batch_size=self.chunk_size)
+            self.stdout.write(f'  orders: {stop}/{count}')
+
+    def reconcile_reserved_stock(self, product_ids):
+        """
+        Set reserved_stock of the seeded products from their open orders, raising
+        stock where it falls short. Products that existed before are left alone.
+        """
+        reserved = OrderItem.objects.filter(
+            product=OuterRef('pk'), order__status__in=RESERVING_STATUSES,
+        ).values('product').annotate(total=Sum('quantity')).values('total')
+        for start in range(0, len(product_ids), self.chunk_size):
+            products = Product.objects.filter(pk__in=list(product_ids[start:start + self.chunk_size]))
+            with transaction.atomic():
+                products.update(reserved_stock=Coalesce(Subquery(reserved), 0))
+                products.filter(stock__lt=F('reserved_stock')).update(stock=F('reserved_stock'))
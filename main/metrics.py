@@ -0,0 +1,179 @@
+"""
+Lightweight in-process request metrics with a Prometheus text endpoint.
+
+``MetricsMiddleware`` records, per view: latency, the number and total time
+of database queries, and the time spent producing serializer ``.data``.
+The product caches report their hits, misses and stale serves here too.
+Everything is kept in plain in-memory counters guarded by a lock, so the
+numbers are per process: scrape every worker (or run one) to see them all.
+"""
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250, 1000)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self.lock:
+            items = sorted(self.values.items())
+        for key, value in items:
+            lines.extend(self.sample_lines(list(zip(self.labelnames, key)), value))
+        return lines
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def sample_lines(self, labels, value):
+        return [f'{self.name}{_labels(labels)} {value}']
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = {'buckets': [0] * len(self.buckets), 'sum': 0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['buckets'][i] += 1
+            state['sum'] += value
+            state['count'] += 1
+
+    def sample_lines(self, labels, state):
+        lines = [
+            f'{self.name}_bucket{_labels(labels + [("le", bound)])} {count}'
+            for bound, count in zip(self.buckets, state['buckets'])
+        ]
+        lines.append(f'{self.name}_bucket{_labels(labels + [("le", "+Inf")])} {state["count"]}')
+        lines.append(f'{self.name}_sum{_labels(labels)} {state["sum"]}')
+        lines.append(f'{self.name}_count{_labels(labels)} {state["count"]}')
+        return lines
+
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Time to produce the response, per view.', ('view', 'method', 'status'),
+)
+REQUEST_QUERIES = Histogram(
+    'http_request_db_queries', 'Database queries issued per request.', ('view',), buckets=QUERY_BUCKETS,
+)
+REQUEST_DB_TIME = Histogram(
+    'http_request_db_duration_seconds', 'Time spent in database queries per request.', ('view',),
+)
+REQUEST_SERIALIZER_TIME = Histogram(
+    'http_request_serializer_duration_seconds', 'Time spent building serializer data per request.', ('view',),
+)
+CACHE_REQUESTS = Counter(
+    'cache_requests_total', 'Cached endpoint lookups by outcome (hit, miss or stale).', ('cache', 'outcome'),
+)
+REGISTRY = (REQUEST_LATENCY, REQUEST_QUERIES, REQUEST_DB_TIME, REQUEST_SERIALIZER_TIME, CACHE_REQUESTS)
+
+
+class RequestStats:
+    """Per-request accumulator the DB wrapper and serializer hook write into."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_seconds += time.perf_counter() - start
+
+
+current_stats = ContextVar('current_request_stats', default=None)
+
+
+def instrument_serializers():
+    """
+    Time the outermost ``.data`` access of DRF serializers during a measured request.
+
+    Installed by ``MainConfig.ready`` only when ``METRICS_ENABLED`` is on.
+    """
+    from rest_framework import serializers
+
+    for cls in (serializers.Serializer, serializers.ListSerializer):
+        fget = cls.data.fget
+        if getattr(fget, 'timed', False):
+            continue
+
+        def data(self, fget=fget):
+            stats = current_stats.get()
+            # Nested serializers are part of their parent's time
+            if stats is None or stats.serializing:
+                return fget(self)
+            stats.serializing = True
+            start = time.perf_counter()
+            try:
+                return fget(self)
+            finally:
+                stats.serializer_seconds += time.perf_counter() - start
+                stats.serializing = False
+
+        data.timed = True
+        cls.data = property(data)
+
+
+def metrics_view(request):
+    """Prometheus text exposition of every metric, guarded by ``METRICS_TOKEN`` (open only in DEBUG without one)."""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        if request.headers.get('Authorization') != f'Bearer {token}':
+            return HttpResponseForbidden()
+    elif not settings.DEBUG:
+        return HttpResponseForbidden()
+    lines = [line for metric in REGISTRY for line in metric.expose()]
+    return HttpResponse('\n'.join(lines) + '\n', content_type=CONTENT_TYPE)
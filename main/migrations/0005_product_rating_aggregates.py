@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:05
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Cast, Coalesce, NullIf, Round
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Product = apps.get_model('main', 'Product')
+    Review = apps.get_model('main', 'Review')
+
+    reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    rating_sum = Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0)
+    rating_count = Coalesce(Subquery(reviews.annotate(total=Count('pk')).values('total')), 0)
+    Product.objects.update(rating_sum=rating_sum, rating_count=rating_count)
+    average = Cast('rating_sum', models.FloatField()) / NullIf('rating_count', 0)
+    # round(double precision, int) doesn't exist on PostgreSQL, so round as a decimal
+    rounded = Round(Cast(average, models.DecimalField(max_digits=5, decimal_places=2)), 2)
+    Product.objects.update(
+        average_rating=Coalesce(Cast(rounded, models.FloatField()), 0.0, output_field=models.FloatField())
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0004_order_shipping_address_line1_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='average_rating',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations
+
+
+def add_search_vector(apps, schema_editor):
+    # SQLite gets its FTS5 table from main.search.ensure_sqlite_fts after every migrate
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        "ALTER TABLE main_product ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+        "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(description, '')), 'B')"
+        ") STORED"
+    )
+    schema_editor.execute(
+        "CREATE INDEX main_product_search_vector_gin ON main_product USING GIN (search_vector)"
+    )
+
+
+def remove_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for trigger in ('main_product_fts_ai', 'main_product_fts_ad', 'main_product_fts_au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        schema_editor.execute('DROP TABLE IF EXISTS main_product_fts')
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS main_product_search_vector_gin')
+    schema_editor.execute('ALTER TABLE main_product DROP COLUMN IF EXISTS search_vector')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0005_product_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_vector, remove_search_vector),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:18
+
+from django.db import migrations, models
+
+
+def backfill_paths(apps, schema_editor):
+    Category = apps.get_model('main', 'Category')
+
+    # Walk the tree level by level so every parent's path is known before its children
+    paths = {None: '/'}
+    level = list(Category.objects.filter(parent__isnull=True).values_list('pk', 'parent_id'))
+    while level:
+        for pk, parent_id in level:
+            paths[pk] = f'{paths[parent_id]}{pk}/'
+            Category.objects.filter(pk=pk).update(path=paths[pk])
+        level = list(Category.objects.filter(parent_id__in=[pk for pk, _ in level]).values_list('pk', 'parent_id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0006_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(backfill_paths, migrations.RunPython.noop),
+    ]
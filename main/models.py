@@ -2,7 +2,10 @@ import uuid
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db.models import Avg
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Concat, NullIf, Round, Substr
+from django.utils import timezone
+from django.utils.functional import cached_property
 import secrets
 
 
@@ -42,16 +45,70 @@ class Category(models.Model):
     description = models.TextField(blank=True)
     slug = models.SlugField(max_length=100, unique=True)
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='subcategories')
+    # Materialized path of ancestor pks, e.g. "/1/5/12/", so a subtree is a single prefix match
+    path = models.CharField(max_length=255, db_index=True, editable=False, default='')
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         verbose_name_plural = 'Categories'
         ordering = ['name']
     
+    def save(self, *args, **kwargs):
+        old_path = self.path
+        parent_path = Category.objects.values_list('path', flat=True).get(pk=self.parent_id) if self.parent_id else '/'
+        if old_path and parent_path.startswith(old_path):
+            raise ValueError('A category cannot be moved under itself or one of its descendants.')
+        
+        if self.pk:
+            self.path = f'{parent_path}{self.pk}/'
+        super().save(*args, **kwargs)
+        
+        if not old_path:
+            # New rows only know their pk after the insert
+            self.path = f'{parent_path}{self.pk}/'
+            Category.objects.filter(pk=self.pk).update(path=self.path)
+        elif self.path != old_path:
+            # Re-root the whole subtree in one statement
+            Category.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                path=Concat(Value(self.path), Substr('path', len(old_path) + 1))
+            )
+    
     def __str__(self):
         return self.name
 
 
+def average_rating_expression(rating_sum, rating_count):
+    """SQL expression for the rounded average of a rating sum and count (0 when unrated)."""
+    average = Cast(rating_sum, models.FloatField()) / NullIf(rating_count, 0)
+    # PostgreSQL only has round(numeric, int), so round as a decimal and hand back a float
+    rounded = Round(Cast(average, models.DecimalField(max_digits=5, decimal_places=2)), 2)
+    return Coalesce(Cast(rounded, models.FloatField()), 0.0, output_field=models.FloatField())
+
+
+class ProductQuerySet(models.QuerySet):
+    def apply_rating_change(self, rating_delta, count_delta):
+        """Incrementally adjust the denormalized rating columns in a single UPDATE."""
+        new_sum = F('rating_sum') + rating_delta
+        new_count = F('rating_count') + count_delta
+        return self.update(
+            rating_sum=new_sum,
+            rating_count=new_count,
+            average_rating=average_rating_expression(new_sum, new_count),
+            updated_at=timezone.now(),
+        )
+
+    def rebuild_rating_aggregates(self):
+        """Recompute the rating columns from the reviews table with set-based subqueries."""
+        reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+        rating_sum = Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0)
+        rating_count = Coalesce(Subquery(reviews.annotate(total=Count('pk')).values('total')), 0)
+        return self.update(
+            rating_sum=rating_sum,
+            rating_count=rating_count,
+            average_rating=average_rating_expression(rating_sum, rating_count),
+        )
+
+
 class Product(models.Model):
     name = models.CharField(max_length=200)
     description = models.TextField()
@@ -64,6 +121,22 @@ class Product(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
 
+    # Denormalized review aggregates, maintained by the Review signals
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    average_rating = models.FloatField(default=0, editable=False)
+
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        # The public listing only reads active products, so these are partial indexes; each ends
+        # with the pk to match the keyset pagination's tiebreaker. The default pk ordering uses the pk itself.
+        indexes = [
+            models.Index(fields=['category', 'id'], condition=Q(is_active=True), name='product_active_category_idx'),
+            models.Index(fields=['price', 'id'], condition=Q(is_active=True), name='product_active_price_idx'),
+            models.Index(fields=['created_at', 'id'], condition=Q(is_active=True), name='product_active_created_idx'),
+        ]
+
     @property
     def in_stock(self):
         return self.available_stock > 0
@@ -72,14 +145,9 @@ class Product(models.Model):
     def available_stock(self):
         return self.stock - self.reserved_stock
     
-    @property
-    def average_rating(self):
-        avg = self.reviews.aggregate(Avg('rating'))['rating__avg']
-        return round(avg, 2) if avg else 0
-    
     @property
     def review_count(self):
-        return self.reviews.count()
+        return self.rating_count
     
     @property
     def is_low_stock(self):
@@ -101,6 +169,11 @@ class Review(models.Model):
     class Meta:
         unique_together = ('product', 'user')
         ordering = ['-created_at']
+        indexes = [
+            # A product's reviews, newest first (ReviewViewSet with ?product=)
+            models.Index(fields=['product', '-created_at', '-id'], name='review_product_created_idx'),
+            models.Index(fields=['-created_at', '-id'], name='review_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username}'s review for {self.product.name}"
@@ -111,13 +184,29 @@ class Cart(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    @cached_property
+    def totals(self):
+        """Total price and item count, from the prefetched items or else one aggregate query."""
+        if 'items' in getattr(self, '_prefetched_objects_cache', {}):
+            items = self.items.all()
+            return {
+                'total_price': sum(item.subtotal for item in items),
+                'total_items': sum(item.quantity for item in items),
+            }
+        
+        totals = self.items.aggregate(
+            total_price=Sum(F('quantity') * F('product__price'), output_field=models.DecimalField(max_digits=12, decimal_places=2)),
+            total_items=Sum('quantity'),
+        )
+        return {key: value or 0 for key, value in totals.items()}
+    
     @property
     def total_price(self):
-        return sum(item.subtotal for item in self.items.all())
+        return self.totals['total_price']
     
     @property
     def total_items(self):
-        return sum(item.quantity for item in self.items.all())
+        return self.totals['total_items']
     
     def __str__(self):
         return f"{self.user.username}'s Cart"
@@ -170,6 +259,17 @@ class Order(models.Model):
     
     products = models.ManyToManyField(Product, through="OrderItem", related_name='orders')
     
+    class Meta:
+        indexes = [
+            # Serves the expired-reservation sweep: status = 'Pending' AND created_at < cutoff
+            models.Index(fields=['status', 'created_at'], name='order_status_created_idx'),
+            # A user's orders newest first, optionally by status (UserOrderListAPIView, OrderViewSet, OrderFilter)
+            models.Index(fields=['user', '-created_at', '-order_id'], name='order_user_created_idx'),
+            models.Index(fields=['user', 'status', '-created_at', '-order_id'], name='order_user_status_idx'),
+            # The staff-wide order list
+            models.Index(fields=['-created_at', '-order_id'], name='order_created_idx'),
+        ]
+    
     def save(self, *args, **kwargs):
         # Generate tracking number if order is shipped and doesn't have one
         if self.status == self.StatusChoices.SHIPPED and not self.tracking_number:
@@ -204,3 +304,15 @@ class OrderItem(models.Model):
     
     def __str__(self):
         return f"{self.quantity} x {self.product.name} in Order {self.order.order_id}"
+
+
+class IdempotencyRecord(models.Model):
+    """Stored response of an idempotent request, used when the cache is unavailable."""
+    key = models.CharField(max_length=64, unique=True)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_data = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Idempotency record {self.key}"
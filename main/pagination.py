@@ -0,0 +1,132 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+class StandardResultsPagination(PageNumberPagination):
+    page_size = 10
+    page_query_param = 'pagenum'
+    page_size_query_param = 'size'
+    max_page_size = 50
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination keyed on the active ordering fields plus the primary key.
+
+    Pages are fetched with a ``(ordering..., pk) > (last row)`` seek filter
+    instead of OFFSET, and no COUNT(*) is issued, so every page costs the
+    same regardless of depth. The ordering honours the view's OrderingFilter
+    (or its ``ordering`` attribute) and the pk is appended as a tiebreaker.
+    """
+    page_size = 10
+    page_size_query_param = 'size'
+    max_page_size = 50
+    ordering = 'pk'
+
+    def get_ordering(self, request, queryset, view):
+        # Views without an OrderingFilter can still declare a default ``ordering``
+        self.ordering = getattr(view, 'ordering', None) or self.ordering
+        return super().get_ordering(request, queryset, view)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        if self.template is not None:
+            self.display_page_controls = True
+
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.keys = self.get_keys(queryset.model)
+        self.cursor = self.decode_cursor(request)
+
+        reverse = self.cursor is not None and self.cursor['reverse']
+        queryset = queryset.order_by(*[
+            f'-{name}' if descending != reverse else name
+            for name, descending in self.keys
+        ])
+        if self.cursor is not None:
+            queryset = queryset.filter(self.get_seek_filter(self.cursor['position'], reverse))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+
+        return self.page
+
+    def get_keys(self, model):
+        """Return ``(field, descending)`` pairs for the ordering, ending with the pk."""
+        pk_name = model._meta.pk.name
+        keys = []
+        for field in self.ordering:
+            name = field.lstrip('-')
+            name = pk_name if name == 'pk' else name
+            keys.append((name, field.startswith('-')))
+            if name == pk_name:
+                return keys
+
+        # The pk follows the direction of the first key so one composite index serves the scan
+        keys.append((pk_name, keys[0][1] if keys else False))
+        return keys
+
+    def get_seek_filter(self, position, reverse):
+        """Build ``k1 > v1 OR (k1 = v1 AND k2 > v2) OR ...`` for the given cursor position."""
+        seek = Q()
+        equal = Q()
+        for (name, descending), value in zip(self.keys, position):
+            lookup = 'lt' if descending != reverse else 'gt'
+            seek |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return seek
+
+    def get_position(self, instance):
+        position = []
+        for name, _ in self.keys:
+            value = instance.serializable_value(name)
+            position.append(value if isinstance(value, (int, float, str)) else str(value))
+        return position
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            payload = json.loads(urlsafe_b64decode(encoded.encode('ascii')).decode('ascii'))
+            ordering = tuple(payload['o'])
+            cursor = {'position': list(payload['p']), 'reverse': bool(payload['r'])}
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+        # A cursor is only meaningful for the ordering it was issued under
+        if ordering != tuple(self.ordering) or len(cursor['position']) != len(self.keys):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def encode_cursor(self, position, reverse):
+        payload = json.dumps({'o': list(self.ordering), 'p': position, 'r': reverse})
+        encoded = urlsafe_b64encode(payload.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.get_position(self.page[-1]), reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.get_position(self.page[0]), reverse=True)
@@ -0,0 +1,25 @@
+import io
+
+from rest_framework.parsers import JSONParser, get_encoding
+
+from .renderers import FastJSONRenderer, orjson
+
+
+class FastJSONParser(JSONParser):
+    """
+    ``JSONParser`` that decodes UTF-8 bodies with orjson when it is installed.
+    Anything orjson rejects (other encodings, integers beyond 64 bits,
+    malformed JSON) is re-parsed by the stdlib parser, so the accepted input
+    and the error messages stay the same.
+    """
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None or get_encoding(parser_context or {}).lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+
+        body = stream.read()
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            return super().parse(io.BytesIO(body), media_type, parser_context)
@@ -0,0 +1,59 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    ``JSONRenderer`` that encodes with orjson when it is installed: compact
+    separators, UTF-8 output and escaped U+2028/U+2029, as on the stdlib path.
+    Types orjson doesn't handle natively (Decimal, lazy strings, querysets...)
+    go through DRF's encoder, and so do datetimes so their format can't drift.
+    Indented output (the browsable API, or ``; indent=`` in the Accept
+    header), non-default JSON settings and integers beyond 64 bits use the
+    stdlib renderer.
+
+    The output matches the stdlib's byte for byte except for floats: those
+    outside [1e-4, 1e16) are spelled differently (``1e16`` and ``0.00001``
+    rather than ``1e+16`` and ``1e-05``, the same values), and NaN and
+    infinity render as ``null`` where the stdlib raises under ``STRICT_JSON``.
+    Checking for them would cost more than the encoding saves.
+    """
+    options = (
+        orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if orjson is not None else 0
+    )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None or self.ensure_ascii or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=self.options)
+        except orjson.JSONEncodeError:
+            # e.g. integers beyond 64 bits, which the stdlib encoder handles
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Newline-delimited JSON. Catalogue dumps stream their own NDJSON body; any
+    other response negotiated to this format (a summary, an error) is written
+    here with one line per list element, or a single line for an object.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        return b''.join(FastJSONRenderer().render(row) + b'\n' for row in rows)
@@ -0,0 +1,148 @@
+"""
+Fast read path for hot serializers.
+
+DRF resolves every field of every row through ``Field.get_attribute`` (a
+generic attribute walk with callable checks and error handling) and then
+``to_representation``. ``FastRepresentationMixin`` compiles each readable
+field once per serializer instance into a direct accessor: an ``attrgetter``
+for plain model attributes, the FK column for primary-key relations and
+inlined conversions for strings, numbers, UUIDs, aware datetimes and
+already-quantized decimals. Anything unusual (a missing related object, a
+callable source, an unquantized decimal) falls back to DRF's own per-field
+code, so the output is identical. Set ``FAST_READ_SERIALIZERS = False`` to
+use plain DRF.
+"""
+import datetime
+import decimal
+from operator import attrgetter
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ObjectDoesNotExist
+from rest_framework import ISO_8601, serializers
+from rest_framework.fields import SkipField
+from rest_framework.relations import PKOnlyObject, PrimaryKeyRelatedField
+
+CONVERTERS = {
+    serializers.ReadOnlyField: None,
+    serializers.CharField: str,
+    serializers.IntegerField: int,
+    serializers.FloatField: float,
+}
+
+
+def fast_serializers_enabled():
+    return getattr(settings, 'FAST_READ_SERIALIZERS', True)
+
+
+def _plain_path(model, attrs):
+    """Whether ``attrs`` walks model fields and properties only, so no step is a method DRF would call."""
+    for i, attr in enumerate(attrs):
+        if model is None:
+            return False
+        try:
+            field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            # A property can only be the last step
+            return i == len(attrs) - 1 and isinstance(getattr(model, attr, None), property)
+        model = field.related_model
+    return True
+
+
+def _decimal_converter(field):
+    places = field.decimal_places
+    coerce_to_string = getattr(field, 'coerce_to_string', serializers.api_settings.COERCE_DECIMAL_TO_STRING)
+    if not coerce_to_string or field.localize or field.normalize_output or places is None:
+        return field.to_representation
+
+    def convert(value):
+        # Database values already carry the column's scale, so quantizing them is a no-op
+        if type(value) is decimal.Decimal and value.as_tuple().exponent == -places:
+            return f'{value:f}'
+        return field.to_representation(value)
+    return convert
+
+
+def _datetime_converter(field):
+    output_format = getattr(field, 'format', serializers.api_settings.DATETIME_FORMAT)
+    if output_format is None or output_format.lower() != ISO_8601:
+        return field.to_representation
+    # Resolved once per response instead of once per value (the active timezone can't change mid-render)
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if field_timezone is None:
+        return field.to_representation
+
+    def convert(value):
+        if type(value) is not datetime.datetime or value.tzinfo is None:
+            return field.to_representation(value)
+        value = value.astimezone(field_timezone).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return convert
+
+
+def _converter(field):
+    field_class = type(field)
+    if field_class in CONVERTERS:
+        return CONVERTERS[field_class]
+    if field_class is serializers.UUIDField and field.uuid_format == 'hex_verbose':
+        return str
+    if field_class is serializers.DecimalField:
+        return _decimal_converter(field)
+    if field_class is serializers.DateTimeField:
+        return _datetime_converter(field)
+    return field.to_representation
+
+
+def compile_accessor(field, model):
+    """Return ``(name, read)`` where ``read(instance)`` gives the field's output or raises ``SkipField``."""
+    def drf_read(instance):
+        attribute = field.get_attribute(instance)
+        check_for_none = attribute.pk if isinstance(attribute, PKOnlyObject) else attribute
+        return None if check_for_none is None else field.to_representation(attribute)
+
+    attrs = field.source_attrs
+    if not attrs:
+        # source='*' (e.g. SerializerMethodField) receives the instance itself
+        return field.field_name, field.to_representation
+    if not _plain_path(model, attrs):
+        return field.field_name, drf_read
+
+    convert = _converter(field)
+    if isinstance(field, PrimaryKeyRelatedField):
+        if len(attrs) != 1 or not field.use_pk_only_optimization() or field.pk_field is not None:
+            return field.field_name, drf_read
+        # Read the FK column instead of loading the related object
+        get = attrgetter(model._meta.get_field(attrs[0]).attname)
+        convert = None
+    else:
+        get = attrgetter('.'.join(attrs))
+
+    def read(instance):
+        try:
+            value = get(instance)
+        except (AttributeError, ObjectDoesNotExist):
+            # e.g. a null FK in a dotted source: let DRF decide between None and skipping the field
+            return drf_read(instance)
+        if value is None or convert is None:
+            return value
+        return convert(value)
+    return field.field_name, read
+
+
+class FastRepresentationMixin:
+    """Serialize through accessors compiled once per serializer instance (see the module docstring)."""
+
+    def to_representation(self, instance):
+        if not fast_serializers_enabled():
+            return super().to_representation(instance)
+        accessors = self.__dict__.get('_accessors')
+        if accessors is None:
+            model = self.Meta.model
+            accessors = self._accessors = [compile_accessor(field, model) for field in self._readable_fields]
+
+        ret = {}
+        for name, read in accessors:
+            try:
+                ret[name] = read(instance)
+            except SkipField:
+                pass
+        return ret
@@ -0,0 +1,131 @@
+"""
+Full-text product search.
+
+PostgreSQL uses the generated ``search_vector`` tsvector column (GIN indexed,
+see migration 0006) with ``ts_rank`` ordering; SQLite uses the
+``main_product_fts`` FTS5 table with bm25 ranking. Both are kept in sync by
+the database itself (generated column / triggers), so bulk writes and
+``update()`` calls are indexed too.
+"""
+import re
+
+from django.db import connection, connections
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+
+SEARCH_CONFIG = 'english'
+FTS_TABLE = 'main_product_fts'
+
+SQLITE_FTS_TRIGGERS = {
+    f'{FTS_TABLE}_ai': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON main_product BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description);
+        END
+    """,
+    f'{FTS_TABLE}_ad': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON main_product BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+        END
+    """,
+    f'{FTS_TABLE}_au': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name, description ON main_product BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+            INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description);
+        END
+    """,
+}
+
+
+def ensure_sqlite_fts(using='default'):
+    """
+    Create the FTS5 table and its sync triggers on SQLite if any are missing.
+
+    SQLite drops a table's triggers whenever Django rebuilds it during a
+    migration, so this runs after every ``migrate`` and reindexes from
+    scratch when it had to recreate anything.
+    """
+    db = connections[using]
+    if db.vendor != 'sqlite':
+        return
+
+    with db.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE name IN ('main_product', %s) "
+            "OR (type = 'trigger' AND tbl_name = 'main_product')",
+            [FTS_TABLE],
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        if 'main_product' not in existing or existing >= {FTS_TABLE, *SQLITE_FTS_TRIGGERS}:
+            return
+
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            f"name, description, content='main_product', content_rowid='id', tokenize='porter unicode61')"
+        )
+        for sql in SQLITE_FTS_TRIGGERS.values():
+            cursor.execute(sql)
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def search_products(queryset, query):
+    """Filter ``queryset`` to products matching ``query``, annotated with a ``search_rank`` (higher is better)."""
+    if connection.vendor == 'postgresql':
+        return _search_postgres(queryset, query)
+    if connection.vendor == 'sqlite':
+        return _search_sqlite(queryset, query)
+    return queryset.filter(name__icontains=query).annotate(search_rank=_constant_rank())
+
+
+def _constant_rank():
+    return RawSQL('0', [], output_field=FloatField())
+
+
+def _search_postgres(queryset, query):
+    from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField
+
+    search_query = SearchQuery(query, search_type='websearch', config=SEARCH_CONFIG)
+    vector = RawSQL('"main_product"."search_vector"', [], output_field=SearchVectorField())
+    return (
+        queryset
+        .alias(search_vector=vector)
+        .filter(search_vector=search_query)
+        .annotate(search_rank=SearchRank(vector, search_query))
+    )
+
+
+def _search_sqlite(queryset, query):
+    # Quote every token so user input can't inject FTS5 query syntax; the trailing * allows prefix matches
+    tokens = re.findall(r'\w+', query)
+    if not tokens:
+        return queryset.annotate(search_rank=_constant_rank()).none()
+    match = ' '.join(f'"{token}"*' for token in tokens)
+
+    # Join the FTS table once: MATCH runs a single time and bm25() ranks the rows it returns.
+    # bm25() is lower-is-better, so negate it; name matches weigh more than description matches
+    rank = RawSQL(f'-bm25("{FTS_TABLE}", 10.0, 1.0)', [], output_field=FloatField())
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[f'"{FTS_TABLE}"."rowid" = "main_product"."id"', f'"{FTS_TABLE}" MATCH %s'],
+        params=[match],
+    ).annotate(search_rank=rank)
+
+
+class FullTextSearchFilter(filters.BaseFilterBackend):
+    """Filters products by the ``q`` parameter (``search`` is accepted as an alias)."""
+    search_params = ('q', 'search')
+
+    def get_search_query(self, request):
+        for param in self.search_params:
+            value = request.query_params.get(param, '').strip()
+            if value:
+                return value
+        return None
+
+    def filter_queryset(self, request, queryset, view):
+        query = self.get_search_query(request)
+        if not query:
+            return queryset
+        return search_products(queryset, query)
@@ -1,6 +1,76 @@
 from rest_framework import serializers
 from .models import Product, Order, OrderItem, User, UserProfile, Category, Review, Cart, CartItem
 from django.db import transaction
+from .carts import apply_cart_lines
+from .inventory import quantities_by_product, release_stock, reserve_stock
+from .representation import FastRepresentationMixin
+
+
+def _split_param(value):
+    return [name.strip() for name in (value or '').split(',') if name.strip()]
+
+
+class SparseFieldsMixin:
+    """
+    Let a read pick its top-level fields with ``?fields=`` / ``?omit=`` and swap
+    in the nested representations of ``expandable_fields`` with ``?expand=``.
+
+    Only GET/HEAD requests are affected, so writes still validate every field.
+    ``prune_queryset`` narrows a queryset to the columns, joins and prefetches
+    the selected fields need; ``field_sources`` and ``field_prefetches`` map
+    fields that don't read a single model column.
+    """
+    expandable_fields = {}
+    field_sources = {}
+    field_prefetches = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sparse = False
+        self.expanded = set()
+        request = self.context.get('request')
+        if request is None or request.method not in ('GET', 'HEAD'):
+            return
+
+        params = request.query_params
+        fields, omit, expand = (_split_param(params.get(name)) for name in ('fields', 'omit', 'expand'))
+        unknown = {name for name in fields + omit if name not in self.fields}
+        unknown.update(name for name in expand if name not in self.expandable_fields)
+        if unknown:
+            raise serializers.ValidationError({'fields': f"Unknown field(s): {', '.join(sorted(unknown))}."})
+        if not (fields or omit or expand):
+            return
+
+        self.sparse = True
+        for name in expand:
+            self.fields[name] = self.expandable_fields[name](read_only=True)
+            self.expanded.add(name)
+        for name in list(self.fields):
+            if (fields and name not in fields and name not in self.expanded) or name in omit:
+                self.fields.pop(name)
+
+    def prune_queryset(self, queryset, keep=()):
+        """Restrict ``queryset`` to what the selected fields read, plus the ``keep`` columns."""
+        if not self.sparse:
+            return queryset
+
+        lookups = {queryset.model._meta.pk.name, *keep} - {'pk'}
+        prefetches = set()
+        for name, field in self.fields.items():
+            if name in self.expanded:
+                lookups.update(f'{field.source}__{child.source}' for child in field.fields.values())
+            else:
+                lookups.update(self.field_sources.get(name, (field.source.replace('.', '__'),)))
+            if name in self.field_prefetches:
+                prefetches.add(self.field_prefetches[name])
+
+        related = {lookup.rsplit('__', 1)[0] for lookup in lookups if '__' in lookup}
+        # A prefetch of 'items__product' already loads 'items'
+        prefetches = {p for p in prefetches if not any(o.startswith(f'{p}__') for o in prefetches)}
+        return (
+            queryset.select_related(None).prefetch_related(None)
+            .select_related(*related).prefetch_related(*prefetches).only(*lookups)
+        )
 
 
 class UserProfileSerializer(serializers.ModelSerializer):
@@ -40,6 +110,12 @@ class UserSerializer(serializers.ModelSerializer):
         )
 
 
+class CategorySummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Category
+        fields = ('id', 'name', 'slug')
+
+
 class CategorySerializer(serializers.ModelSerializer):
     products_count = serializers.SerializerMethodField()
     
@@ -55,7 +131,15 @@ class CategorySerializer(serializers.ModelSerializer):
             'created_at',
         )
     
+    def validate_parent(self, parent):
+        if parent and self.instance and self.instance.path and parent.path.startswith(self.instance.path):
+            raise serializers.ValidationError("A category cannot be moved under itself or one of its descendants.")
+        return parent
+    
     def get_products_count(self, obj):
+        # Annotated by CategoryViewSet; only freshly created/updated instances need a query
+        if hasattr(obj, 'products_count'):
+            return obj.products_count
         return obj.products.count()
 
 
@@ -83,13 +167,20 @@ class ReviewSerializer(serializers.ModelSerializer):
         return value
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(FastRepresentationMixin, SparseFieldsMixin, serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.name', read_only=True)
     average_rating = serializers.ReadOnlyField()
     review_count = serializers.ReadOnlyField()
     available_stock = serializers.ReadOnlyField()
     is_low_stock = serializers.ReadOnlyField()
     
+    expandable_fields = {'category': CategorySummarySerializer}
+    field_sources = {
+        'available_stock': ('stock', 'reserved_stock'),
+        'is_low_stock': ('stock', 'reserved_stock'),
+        'review_count': ('rating_count',),
+    }
+    
     class Meta:
         model = Product
         fields = (
@@ -118,7 +209,7 @@ class ProductSerializer(serializers.ModelSerializer):
         return value
 
 
-class CartItemSerializer(serializers.ModelSerializer):
+class CartItemSerializer(FastRepresentationMixin, serializers.ModelSerializer):
     product_name = serializers.CharField(source='product.name', read_only=True)
     product_price = serializers.DecimalField(
         max_digits=10,
@@ -156,7 +247,7 @@ class CartItemSerializer(serializers.ModelSerializer):
         return data
 
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(FastRepresentationMixin, serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
     total_price = serializers.ReadOnlyField()
     total_items = serializers.ReadOnlyField()
@@ -175,7 +266,7 @@ class CartSerializer(serializers.ModelSerializer):
         read_only_fields = ('user',)
 
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(FastRepresentationMixin, serializers.ModelSerializer):
     product_name = serializers.CharField(source='product.name', read_only=True)
     product_price = serializers.DecimalField(
         max_digits=10,
@@ -195,11 +286,78 @@ class OrderItemSerializer(serializers.ModelSerializer):
         )
 
 
+class BatchedProductField(serializers.PrimaryKeyRelatedField):
+    """Resolves products from a batch preloaded by the parent list serializer."""
+    products = None
+
+    def to_internal_value(self, data):
+        if self.products is not None:
+            try:
+                product = self.products.get(int(data))
+            except (TypeError, ValueError):
+                product = None
+            if product is not None:
+                return product
+        # Unknown or malformed ids fall back to the regular lookup and its error messages
+        return super().to_internal_value(data)
+
+
+class ProductLineListSerializer(serializers.ListSerializer):
+    """
+    List serializer for ``{product, quantity}`` lines (order items and cart batches alike)
+    whose child resolves ``product`` through a ``BatchedProductField``.
+    """
+    def to_internal_value(self, data):
+        # Load every referenced product in one query instead of one per line
+        if isinstance(data, list):
+            product_ids = set()
+            for item in data:
+                try:
+                    product_ids.add(int(item['product']))
+                except (KeyError, TypeError, ValueError):
+                    continue
+            self.child.fields['product'].products = Product.objects.in_bulk(product_ids)
+        return super().to_internal_value(data)
+
+
+class CartBatchSerializer(serializers.Serializer):
+    """Applies a list of cart line upserts (quantity > 0) and removals (quantity 0) in one go."""
+    class CartLineSerializer(serializers.Serializer):
+        product = BatchedProductField(queryset=Product.objects.all())
+        quantity = serializers.IntegerField(min_value=0)
+
+        class Meta:
+            list_serializer_class = ProductLineListSerializer
+
+    items = CartLineSerializer(many=True, allow_empty=False, max_length=100)
+
+    def validate_items(self, items):
+        seen = set()
+        for item in items:
+            product = item['product']
+            if product.pk in seen:
+                raise serializers.ValidationError(f"{product.name} is listed more than once.")
+            seen.add(product.pk)
+            
+            # Products were loaded in one query by the list serializer, so this check is free
+            if item['quantity'] > product.available_stock:
+                raise serializers.ValidationError(
+                    f"Only {product.available_stock} units of {product.name} available."
+                )
+        return items
+
+    def save(self, cart):
+        return apply_cart_lines(cart, {line['product']: line['quantity'] for line in self.validated_data['items']})
+
+
 class OrderCreateSerializer(serializers.ModelSerializer):
     class OrderItemCreateSerializer(serializers.ModelSerializer):
+        product = BatchedProductField(queryset=Product.objects.all())
+
         class Meta:
             model = OrderItem
             fields = ('product', 'quantity')
+            list_serializer_class = ProductLineListSerializer
         
         def validate_quantity(self, value):
             if value < 1:
@@ -233,6 +391,18 @@ class OrderCreateSerializer(serializers.ModelSerializer):
         
         return items
 
+    @staticmethod
+    def build_items(order, orderitem_data):
+        return [
+            OrderItem(
+                order=order,
+                product=item['product'],
+                quantity=item['quantity'],
+                price_at_purchase=item['product'].price
+            )
+            for item in orderitem_data
+        ]
+
     def create(self, validated_data):
         orderitem_data = validated_data.pop('items')
         
@@ -240,22 +410,13 @@ class OrderCreateSerializer(serializers.ModelSerializer):
             # Create order
             order = Order.objects.create(**validated_data)
 
-            # Create order items and reserve stock
-            for item in orderitem_data:
-                product = item['product']
-                quantity = item['quantity']
-                
-                # Reserve stock
-                product.reserved_stock += quantity
-                product.save()
-                
-                # Create order item with price snapshot
-                OrderItem.objects.create(
-                    order=order,
-                    product=product,
-                    quantity=quantity,
-                    price_at_purchase=product.price
-                )
+            # Reserve stock for every line with guarded F() updates
+            reserve_stock(quantities_by_product(
+                (item['product'].pk, item['quantity']) for item in orderitem_data
+            ))
+
+            # Create order items with price snapshot
+            OrderItem.objects.bulk_create(self.build_items(order, orderitem_data))
 
         return order
 
@@ -268,34 +429,19 @@ class OrderCreateSerializer(serializers.ModelSerializer):
             
             if orderitem_data is not None:
                 # Return reserved stock from old items
-                for old_item in instance.items.all():
-                    old_item.product.reserved_stock -= old_item.quantity
-                    old_item.product.save()
+                release_stock(quantities_by_product(
+                    instance.items.values_list('product_id', 'quantity')
+                ))
                 
                 # Clear existing items
                 instance.items.all().delete()
                 
-                # Create new items and reserve stock
-                for item in orderitem_data:
-                    product = item['product']
-                    quantity = item['quantity']
-                    
-                    # Validate stock again
-                    if quantity > product.available_stock:
-                        raise serializers.ValidationError(
-                            f"Only {product.available_stock} units of {product.name} available."
-                        )
-                    
-                    # Reserve stock
-                    product.reserved_stock += quantity
-                    product.save()
-                    
-                    OrderItem.objects.create(
-                        order=instance,
-                        product=product,
-                        quantity=quantity,
-                        price_at_purchase=product.price
-                    )
+                # Reserve stock for the new items; the guard re-validates availability
+                reserve_stock(quantities_by_product(
+                    (item['product'].pk, item['quantity']) for item in orderitem_data
+                ))
+                
+                OrderItem.objects.bulk_create(self.build_items(instance, orderitem_data))
             
         return instance
         
@@ -318,12 +464,67 @@ class OrderCreateSerializer(serializers.ModelSerializer):
         }
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class CartCheckoutSerializer(serializers.Serializer):
+    """Turns the user's cart into an order; shipping fields default to the user's profile."""
+    shipping_address_line1 = serializers.CharField(max_length=255, required=False, allow_blank=True)
+    shipping_address_line2 = serializers.CharField(max_length=255, required=False, allow_blank=True)
+    shipping_city = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    shipping_state = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    shipping_postal_code = serializers.CharField(max_length=20, required=False, allow_blank=True)
+    shipping_country = serializers.CharField(max_length=100, required=False, allow_blank=True)
+
+    def shipping_data(self, user):
+        shipping = dict(self.validated_data)
+        missing = [name for name in self.fields if name not in shipping]
+        if missing:
+            profile = UserProfile.objects.filter(user=user).first()
+            for name in missing:
+                shipping[name] = getattr(profile, name, '') if profile is not None else ''
+        return shipping
+
+    def save(self, user):
+        with transaction.atomic():
+            # Lock the cart so concurrent checkouts can't turn the same lines into two orders
+            cart = Cart.objects.select_for_update().filter(user=user).first()
+            cart_items = list(cart.items.select_related('product')) if cart is not None else []
+            if not cart_items:
+                raise serializers.ValidationError({'cart': 'Cart is empty.'})
+
+            # The guarded UPDATE is the only stock check; it raises InsufficientStock (409) on a shortfall
+            reserve_stock(quantities_by_product((item.product_id, item.quantity) for item in cart_items))
+
+            order = Order.objects.create(user=user, **self.shipping_data(user))
+            OrderItem.objects.bulk_create(
+                OrderItem(
+                    order=order,
+                    product=item.product,
+                    quantity=item.quantity,
+                    price_at_purchase=item.product.price,
+                )
+                for item in cart_items
+            )
+            cart.items.all().delete()
+
+        return order
+
+
+class UserSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ('id', 'username', 'email')
+
+
+class OrderSerializer(FastRepresentationMixin, SparseFieldsMixin, serializers.ModelSerializer):
     order_id = serializers.UUIDField(read_only=True)
     items = OrderItemSerializer(many=True, read_only=True)
     total_price = serializers.SerializerMethodField(method_name='total')
     user_username = serializers.CharField(source='user.username', read_only=True)
 
+    expandable_fields = {'user': UserSummarySerializer}
+    field_sources = {'items': (), 'total_price': ()}
+    # The total only needs the items' price snapshots, not their products
+    field_prefetches = {'items': 'items__product', 'total_price': 'items'}
+
     def total(self, obj):
         order_items = obj.items.all()
         return sum(order_item.item_subtotal for order_item in order_items)
@@ -350,6 +551,6 @@ class OrderSerializer(serializers.ModelSerializer):
 
 
 class ProductInfoSerializer(serializers.Serializer):
-    products = ProductSerializer(many=True)
+    products = ProductSerializer(many=True, required=False)
     count = serializers.IntegerField()
     max_price = serializers.FloatField()
@@ -1,7 +1,11 @@
-from django.db.models.signals import post_save, post_delete
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_migrate, post_save, post_delete, pre_save
+from django.db import transaction
 from django.dispatch import receiver
-from main.models import Product, User, UserProfile, Order
-from django.core.cache import cache
+from main.models import Category, Product, User, UserProfile, Order, Review
+from main.carts import get_cart_token, merge_session_cart, session_carts_enabled
+from main.caching import CATALOG, bump, invalidate_orders, invalidate_products
+from main.search import ensure_sqlite_fts
 
 
 @receiver(post_save, sender=User)
@@ -18,16 +22,69 @@ def save_user_profile(sender, instance, **kwargs):
         instance.profile.save()
 
 
+@receiver(pre_save, sender=Product)
+def remember_previous_category(sender, instance, **kwargs):
+    """Store the category currently in the database so a moved product invalidates both listings."""
+    instance._previous_category_id = None
+    if instance.pk:
+        instance._previous_category_id = (
+            Product.objects.filter(pk=instance.pk).values_list('category_id', flat=True).first()
+        )
+
+
 @receiver([post_save, post_delete], sender=Product)
 def invalidate_product_cache(sender, instance, **kwargs):
     """Invalidates the cache for products."""
-    print("Invalidating products cache")
-    # Using pattern matching for Redis cache
-    try:
-        cache.delete_many(cache.keys("*product_list*"))
-    except:
-        # Fallback if pattern matching is not available
-        pass
+    category_ids = {instance.category_id, getattr(instance, '_previous_category_id', None)} - {None}
+    invalidate_products([instance.pk], category_ids=category_ids)
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_catalog_cache(sender, instance, **kwargs):
+    """Category names are embedded in every product payload, so drop the whole catalog."""
+    transaction.on_commit(lambda: bump(CATALOG))
+
+
+@receiver(pre_save, sender=Review)
+def remember_previous_rating(sender, instance, **kwargs):
+    """Store the rating currently in the database so an edit can be applied as a delta."""
+    instance._previous_rating = None
+    if instance.pk:
+        instance._previous_rating = (
+            Review.objects.filter(pk=instance.pk).values_list('product_id', 'rating').first()
+        )
+
+
+@receiver(post_save, sender=Review)
+def update_rating_on_save(sender, instance, created, **kwargs):
+    """Keep the product's rating aggregates in sync with a created or edited review."""
+    previous = getattr(instance, '_previous_rating', None)
+    if created or previous is None:
+        Product.objects.filter(pk=instance.product_id).apply_rating_change(instance.rating, 1)
+        invalidate_products([instance.product_id])
+        return
+
+    previous_product_id, previous_rating = previous
+    if previous_product_id != instance.product_id:
+        Product.objects.filter(pk=previous_product_id).apply_rating_change(-previous_rating, -1)
+        Product.objects.filter(pk=instance.product_id).apply_rating_change(instance.rating, 1)
+        invalidate_products([previous_product_id, instance.product_id])
+    elif previous_rating != instance.rating:
+        Product.objects.filter(pk=instance.product_id).apply_rating_change(instance.rating - previous_rating, 0)
+        invalidate_products([instance.product_id])
+
+
+@receiver(post_delete, sender=Review)
+def update_rating_on_delete(sender, instance, **kwargs):
+    """Remove a deleted review from the product's rating aggregates."""
+    Product.objects.filter(pk=instance.product_id).apply_rating_change(-instance.rating, -1)
+    invalidate_products([instance.product_id])
+
+
+@receiver([post_save, post_delete], sender=Order)
+def invalidate_order_cache(sender, instance, **kwargs):
+    """Bump the owner's order list version so cached listings show the change."""
+    invalidate_orders([instance.user_id])
 
 
 @receiver(post_save, sender=Order)
@@ -39,4 +96,18 @@ def send_low_stock_alerts(sender, instance, created, **kwargs):
                 print(f"LOW STOCK ALERT: {item.product.name} has only {item.product.available_stock} units left!")
                 # Here you could send an email to admins or trigger a notification
 
-    
\ No newline at end of file
+    
+
+@receiver(post_migrate)
+def ensure_search_index(sender, using, **kwargs):
+    """Make sure the SQLite full-text index exists and is wired to the product table."""
+    if sender.name == 'main':
+        ensure_sqlite_fts(using)
+
+
+@receiver(user_logged_in)
+def merge_anonymous_cart(sender, request, user, **kwargs):
+    """Fold the cart built before a session login into the user's cart."""
+    token = get_cart_token(request) if request is not None else None
+    if token and session_carts_enabled():
+        merge_session_cart(token, user)
@@ -1,8 +1,13 @@
+import logging
+from datetime import timedelta
+
 from celery import shared_task
 from django.core.mail import send_mail
 from django.conf import settings
 from django.template.loader import render_to_string
 
+logger = logging.getLogger(__name__)
+
 
 @shared_task
 def send_order_confirmation_email(order_id, user_email):
@@ -115,3 +120,29 @@ def check_low_stock_products():
             return f"Failed to send alert: {str(e)}"
     
     return "No low stock products found"
+
+
+@shared_task
+def release_expired_reservations():
+    """Periodic task that cancels abandoned Pending orders and frees the stock they hold."""
+    from main.inventory import release_expired_reservations as release
+    
+    hold_for = timedelta(minutes=settings.RESERVATION_HOLD_MINUTES)
+    cancelled, released = release(hold_for, batch_size=settings.RESERVATION_SWEEP_BATCH_SIZE)
+    
+    logger.info(
+        'Reservation sweep cancelled %d orders and released %d units',
+        cancelled, released,
+        extra={'cancelled_orders': cancelled, 'released_units': released},
+    )
+    return f"Cancelled {cancelled} expired orders and released {released} reserved units"
+
+
+@shared_task
+def purge_idempotency_records():
+    """Periodic task that deletes stored idempotent responses older than IDEMPOTENCY_TTL."""
+    from main.idempotency import purge_expired
+    
+    deleted = purge_expired()
+    logger.info('Purged %d expired idempotency records', deleted, extra={'deleted_records': deleted})
+    return f"Deleted {deleted} expired idempotency records"
@@ -1,11 +1,84 @@
-from django.test import TestCase
+import hashlib
+import json
+import re
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest.mock import patch
+
+from django.conf import settings
+from django.core.cache import cache
+
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count, F, Prefetch, Sum
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 # The method reverse is used to get the URL of a view by its name
 from django.urls import reverse
 from rest_framework import status
 
-from .models import Order, OrderItem, Product, User
+from .models import (
+    Cart, CartItem, Category, IdempotencyRecord, Order, OrderItem, Product, Review, User, UserProfile
+)
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from .carts import CART_TOKEN_HEADER, SessionCart
+from . import benchmarks, metrics
+from .caching import (
+    CACHE_HEADER, CATALOG, ORDERS, PRODUCT_LIST, bump, cache_response, category_tag, get_generations, get_stats,
+    order_tag, product_tag,
+)
+from .exceptions import InsufficientStock
+from .idempotency import REPLAYED_HEADER
+from .filters import ProductFilter
+from .inventory import consume_stock, release_expired_reservations, release_stock, reserve_stock
+from .pagination import KeysetPagination
+from .parsers import FastJSONParser
+from .renderers import FastJSONRenderer
+from .search import search_products
+from .serializers import CartSerializer, OrderCreateSerializer, OrderSerializer, ProductSerializer
+from .tasks import purge_idempotency_records
+from .views import (
+    CartViewSet, CategoryViewSet, OrderViewSet, ProductDetailAPIView, ProductInfoAPIView, ProductListCreateAPIView,
+    ReviewViewSet, UserOrderListAPIView,
+)
+
+
+def app_selects(queries):
+    """SELECTs against this app's tables, ignoring the profiling queries silk records alongside them."""
+    return [q for q in queries.captured_queries if q['sql'].startswith('SELECT') and '"main_' in q['sql']]
+
+
+def app_queries(queries):
+    """Every query except the ones silk issues to profile the request."""
+    return [q for q in queries.captured_queries if 'silk_' not in q['sql'] and not q['sql'].startswith('EXPLAIN')]
+
+
+# Random silk sampling would make the query counts below nondeterministic
+silk_off = override_settings(SILK_SAMPLE_RATE=0)
+
+
+def setUpModule():
+    silk_off.enable()
+
+
+def tearDownModule():
+    silk_off.disable()
+
+
+# Classes that need a cold cache get an in-process one instead of the Redis a dev stack may be using
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'main-tests'}}
+
 
-from rest_framework.test import APITestCase
 # Create your tests here.
 class UserOrderTest(TestCase):
     def setUp(self):
@@ -60,3 +133,1132 @@ class ProductAPITestCase(APITestCase):
         self.client.login(username='admin', password='adminpass')
         response = self.client.delete(self.url)
         self.assertEqual(response.status_code, 204)  # No content on successful deletion
+
+
+class ProductRatingAggregateTest(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username='user1', password='test')
+        self.user2 = User.objects.create_user(username='user2', password='test')
+        self.product = Product.objects.create(name='Rated Product', description='Description', price=10.00, stock=5)
+
+    def test_aggregates_follow_review_create_update_delete(self):
+        review = Review.objects.create(product=self.product, user=self.user1, rating=5)
+        Review.objects.create(product=self.product, user=self.user2, rating=2)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_sum, self.product.rating_count), (7, 2))
+        self.assertEqual(self.product.average_rating, 3.5)
+
+        review.rating = 3
+        review.save()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_sum, self.product.rating_count), (5, 2))
+        self.assertEqual(self.product.average_rating, 2.5)
+
+        review.delete()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_sum, self.product.review_count), (2, 1))
+        self.assertEqual(self.product.average_rating, 2.0)
+
+    def test_rebuild_ratings_command(self):
+        Review.objects.create(product=self.product, user=self.user1, rating=4)
+        Review.objects.create(product=self.product, user=self.user2, rating=5)
+        Review.objects.create(product=self.product, user=User.objects.create_user(username='user3'), rating=5)
+        Product.objects.update(rating_sum=0, rating_count=0, average_rating=0)
+
+        call_command('rebuild_ratings', stdout=StringIO())
+
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_sum, self.product.rating_count), (14, 3))
+        self.assertEqual(self.product.average_rating, 4.67)
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.products = [
+            Product.objects.create(name=f'Product {i}', description='Description', price=10 + i % 3, stock=5)
+            for i in range(12)
+        ]
+
+    def paginate(self, url, view):
+        paginator = KeysetPagination()
+        paginator.page_size = 5
+        page = paginator.paginate_queryset(Product.objects.all(), Request(self.factory.get(url)), view)
+        return paginator, page
+
+    def test_walks_every_row_once_with_ties_on_ordering_field(self):
+        view = ProductListCreateAPIView()
+        url = '/api/products/?ordering=-price'
+        seen = []
+        with CaptureQueriesContext(connection) as queries:
+            while url:
+                paginator, page = self.paginate(url, view)
+                seen.extend(page)
+                url = paginator.get_next_link()
+
+        self.assertEqual(len(seen), len(self.products))
+        self.assertEqual(len({p.pk for p in seen}), len(self.products))
+        self.assertEqual(
+            [(p.price, p.pk) for p in seen],
+            sorted([(p.price, p.pk) for p in seen], key=lambda key: (-key[0], -key[1])),
+        )
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries.captured_queries))
+
+    def test_previous_link_returns_preceding_page(self):
+        view = ProductListCreateAPIView()
+        first_paginator, first_page = self.paginate('/api/products/', view)
+        paginator, _ = self.paginate(first_paginator.get_next_link(), view)
+        _, previous_page = self.paginate(paginator.get_previous_link(), view)
+        self.assertEqual(previous_page, first_page)
+
+
+class StockReservationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='test')
+        self.camera = Product.objects.create(name='Camera', description='Description', price=100, stock=5)
+        self.laptop = Product.objects.create(name='Laptop', description='Description', price=900, stock=2)
+
+    def test_reserve_is_all_or_nothing(self):
+        with self.assertRaises(InsufficientStock):
+            reserve_stock({self.camera.pk: 3, self.laptop.pk: 3})
+
+        self.camera.refresh_from_db()
+        self.laptop.refresh_from_db()
+        self.assertEqual((self.camera.reserved_stock, self.laptop.reserved_stock), (0, 0))
+
+    def test_release_and_consume(self):
+        reserve_stock({self.camera.pk: 3})
+        release_stock({self.camera.pk: 1})
+        consume_stock({self.camera.pk: 2})
+
+        self.camera.refresh_from_db()
+        self.assertEqual((self.camera.stock, self.camera.reserved_stock), (3, 0))
+
+    def test_rows_are_locked_in_pk_order_before_the_update(self):
+        for operation in (reserve_stock, release_stock, consume_stock):
+            with CaptureQueriesContext(connection) as queries:
+                operation({self.laptop.pk: 1, self.camera.pk: 1})
+            statements = [q['sql'] for q in app_queries(queries) if not q['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+            self.assertTrue(statements[0].startswith('SELECT'), statements)
+            self.assertIn('ORDER BY', statements[0])
+            self.assertTrue(statements[1].startswith('UPDATE'), statements)
+
+    def test_order_create_does_not_oversell_stale_product(self):
+        serializer = OrderCreateSerializer(data={'items': [{'product': self.laptop.pk, 'quantity': 2}]})
+        self.assertTrue(serializer.is_valid())
+
+        # Another checkout reserves the remaining units after validation
+        Product.objects.filter(pk=self.laptop.pk).update(reserved_stock=1)
+
+        with self.assertRaises(InsufficientStock):
+            serializer.save(user=self.user)
+        self.assertFalse(Order.objects.exists())
+        self.laptop.refresh_from_db()
+        self.assertEqual(self.laptop.reserved_stock, 1)
+
+
+class OrderPipelineQueryCountTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='b2b', password='test')
+        self.products = [
+            Product.objects.create(name=f'Part {i}', description='Description', price=5, stock=100)
+            for i in range(20)
+        ]
+
+    def create_order(self, line_count):
+        serializer = OrderCreateSerializer(data={
+            'items': [{'product': product.pk, 'quantity': 2} for product in self.products[:line_count]]
+        })
+        with CaptureQueriesContext(connection) as queries:
+            serializer.is_valid(raise_exception=True)
+            order = serializer.save(user=self.user)
+        return order, len(queries.captured_queries)
+
+    def test_order_creation_query_count_is_independent_of_line_count(self):
+        _, single_line_queries = self.create_order(1)
+        order, many_line_queries = self.create_order(20)
+
+        self.assertEqual(single_line_queries, many_line_queries)
+        self.assertEqual(order.items.count(), 20)
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).reserved_stock, 4)
+
+
+class ReservationSweepTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='abandoner', password='test')
+        self.product = Product.objects.create(name='Camera', description='Description', price=100, stock=10)
+
+    def place_order(self, quantity, age):
+        serializer = OrderCreateSerializer(data={'items': [{'product': self.product.pk, 'quantity': quantity}]})
+        serializer.is_valid(raise_exception=True)
+        order = serializer.save(user=self.user)
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - age)
+        return order
+
+    def test_expired_pending_orders_are_cancelled_in_batches(self):
+        expired = [self.place_order(2, timedelta(hours=2)) for _ in range(3)]
+        recent = self.place_order(1, timedelta(minutes=5))
+        confirmed = self.place_order(1, timedelta(hours=2))
+        Order.objects.filter(pk=confirmed.pk).update(status=Order.StatusChoices.CONFIRMED)
+
+        self.assertEqual(release_expired_reservations(timedelta(hours=1), batch_size=2), (3, 6))
+        statuses = dict(Order.objects.values_list('pk', 'status'))
+        self.assertTrue(all(statuses[order.pk] == Order.StatusChoices.CANCELLED for order in expired))
+        self.assertEqual(statuses[recent.pk], Order.StatusChoices.PENDING)
+        self.assertEqual(statuses[confirmed.pk], Order.StatusChoices.CONFIRMED)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).reserved_stock, 2)
+
+
+@override_settings(CACHES=TEST_CACHES)
+@patch.object(OrderViewSet, 'throttle_classes', [])
+class OrderListCacheTest(APITestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name='Camera', description='Description', price=100, stock=10)
+        self.alice = User.objects.create_user(username='alice', password='test')
+        self.bob = User.objects.create_user(username='bob', password='test')
+        self.admin = User.objects.create_superuser(username='admin', password='test')
+        self.order = self.place_order(self.alice)
+        self.place_order(self.bob)
+
+    def place_order(self, user):
+        serializer = OrderCreateSerializer(data={'items': [{'product': self.product.pk, 'quantity': 1}]})
+        serializer.is_valid(raise_exception=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            return serializer.save(user=user)
+
+    def list_orders(self, user, params=None):
+        self.client.force_authenticate(user)
+        response = self.client.get(reverse('order-list'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response
+
+    def test_lists_are_cached_per_user(self):
+        self.assertEqual(self.list_orders(self.alice)[CACHE_HEADER], 'MISS')
+        self.assertEqual(self.list_orders(self.alice)[CACHE_HEADER], 'HIT')
+        response = self.list_orders(self.bob)
+        self.assertEqual(response[CACHE_HEADER], 'MISS')
+        self.assertEqual([o['user'] for o in response.json()['results']], [self.bob.pk])
+        # Filter parameters get their own entries
+        self.assertEqual(self.list_orders(self.alice, {'status': 'Cancelled'})[CACHE_HEADER], 'MISS')
+        self.assertEqual(self.list_orders(self.alice, {'status': 'Cancelled'}).json()['results'], [])
+
+    def test_order_changes_invalidate_only_the_owner(self):
+        self.list_orders(self.alice)
+        self.list_orders(self.bob)
+        self.place_order(self.alice)
+        response = self.list_orders(self.alice)
+        self.assertEqual(response[CACHE_HEADER], 'MISS')
+        self.assertEqual(len(response.json()['results']), 2)
+        self.assertEqual(self.list_orders(self.bob)[CACHE_HEADER], 'HIT')
+
+        self.client.force_authenticate(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('order-update-status', kwargs={'pk': self.order.pk}), {'status': 'Confirmed'})
+        statuses = {o['order_id']: o['status'] for o in self.list_orders(self.alice).json()['results']}
+        self.assertEqual(statuses[str(self.order.pk)], 'Confirmed')
+
+    def test_reservation_sweep_invalidates_order_lists(self):
+        self.list_orders(self.bob)
+        Order.objects.update(created_at=timezone.now() - timedelta(hours=2))
+        with self.captureOnCommitCallbacks(execute=True):
+            release_expired_reservations(timedelta(hours=1), batch_size=10)
+        response = self.list_orders(self.bob)
+        self.assertEqual(response[CACHE_HEADER], 'MISS')
+        self.assertEqual(response.json()['results'][0]['status'], 'Cancelled')
+
+
+class SeedDataTest(TestCase):
+    def test_scale_seed_is_consistent(self):
+        # A pre-existing row whose counters the seed must not rewrite
+        existing = Product.objects.create(name='Existing', description='Description', price=5, stock=1, reserved_stock=1)
+        call_command('seed_data', products=200, users=30, orders=150, reviews=100, categories=20, seed=7,
+                     chunk_size=64, stdout=StringIO())
+
+        self.assertEqual(Product.objects.get(pk=existing.pk).reserved_stock, 1)
+        self.assertEqual(Product.objects.exclude(pk=existing.pk).count(), 200)
+        self.assertEqual(Order.objects.count(), 150)
+        self.assertEqual(UserProfile.objects.filter(user__username__startswith='load7-').count(), 30)
+        self.assertFalse(Category.objects.filter(path='').exists())
+        # Denormalized columns match the generated rows
+        self.assertFalse(Product.objects.filter(stock__lt=F('reserved_stock')).exists())
+        self.assertEqual(Product.objects.aggregate(total=Sum('rating_count'))['total'], Review.objects.count())
+        pending = OrderItem.objects.filter(order__status='Pending').aggregate(total=Sum('quantity'))['total'] or 0
+        seeded = Product.objects.exclude(pk=existing.pk)
+        self.assertGreaterEqual(seeded.aggregate(total=Sum('reserved_stock'))['total'], pending)
+
+
+class UserListTest(APITestCase):
+    def test_profiles_are_loaded_with_their_users(self):
+        admin = User.objects.create_superuser(username='admin', password='test')
+        for i in range(5):
+            User.objects.create_user(username=f'user{i}', password='test', email=f'user{i}@example.com')
+        self.client.force_authenticate(admin)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('user-list'))
+
+        self.assertEqual([user['username'] for user in response.json()], ['admin', *[f'user{i}' for i in range(5)]])
+        self.assertTrue(all(user['profile'] is not None for user in response.json()))
+        self.assertEqual(len(app_selects(queries)), 1)
+
+
+class EndpointBenchmarkTest(TestCase):
+    def test_every_endpoint_is_benchmarked_successfully(self):
+        call_command('seed_data', products=60, users=10, orders=40, categories=8, seed=3, stdout=StringIO())
+        User.objects.create_superuser(username='bench-admin', password='test')
+
+        results = benchmarks.run(repeat=2)
+        self.assertEqual(set(results), set(benchmarks.load(benchmarks.BUDGETS_PATH)))
+        for name, metrics in results.items():
+            self.assertTrue(all(200 <= code < 300 for code in metrics['status']), (name, metrics['status']))
+        self.assertEqual(Order.objects.count(), 40)
+
+        previous = {'product-list': dict(results['product-list'], queries=results['product-list']['queries'] - 1)}
+        regressed = [row for row in benchmarks.compare(results, previous) if row[-1]]
+        self.assertEqual([(name, metric) for name, metric, *_ in regressed], [('product-list', 'queries')])
+        self.assertEqual(benchmarks.over_budget(results, {'product-list': {'queries': 0}})[0][:2], ('product-list', 'queries'))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RequestMetricsTest(APITestCase):
+    def setUp(self):
+        for metric in metrics.REGISTRY:
+            metric.clear()
+        category = Category.objects.create(name='Electronics', slug='electronics')
+        Product.objects.create(name='Camera', description='Description', price=100, stock=5, category=category)
+        # Signal-driven invalidation only runs on commit, which TestCase never does
+        bump(PRODUCT_LIST)
+
+    def test_metrics_endpoint_exposes_request_metrics(self):
+        self.client.get(reverse('products'))
+        self.client.get(reverse('products'))
+        with override_settings(DEBUG=True):
+            response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+
+        self.assertIn('http_request_duration_seconds_count{view="products",method="GET",status="200"} 2', body)
+        self.assertRegex(body, r'http_request_db_queries_count\{view="products"\} 2')
+        self.assertRegex(body, r'http_request_serializer_duration_seconds_sum\{view="products"\} [0-9.e-]+')
+        self.assertIn('cache_requests_total{cache="product_list",outcome="miss"} 1', body)
+        self.assertIn('cache_requests_total{cache="product_list",outcome="hit"} 1', body)
+
+    def test_metrics_token(self):
+        # Without a token the endpoint is closed outside DEBUG
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_403_FORBIDDEN)
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_403_FORBIDDEN)
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(SILK_SAMPLE_RATE=0, SILK_PROFILE_TOKEN='secret')
+    def test_silk_is_sampled_or_requested_by_header(self):
+        intercept = settings.SILKY_INTERCEPT_FUNC
+        factory = APIRequestFactory()
+        self.assertTrue(intercept(factory.get('/', HTTP_X_SILK_PROFILE='secret')))
+        self.assertFalse(intercept(factory.get('/', HTTP_X_SILK_PROFILE='wrong')))
+        self.assertFalse(intercept(factory.get('/')))
+        with override_settings(SILK_SAMPLE_RATE=1):
+            self.assertTrue(intercept(factory.get('/')))
+
+
+class ProductCacheInvalidationTest(TestCase):
+    def setUp(self):
+        self.electronics = Category.objects.create(name='Electronics', slug='electronics')
+        self.books = Category.objects.create(name='Books', slug='books')
+        self.product = Product.objects.create(
+            name='Camera', description='Description', price=100, stock=5, category=self.electronics
+        )
+        self.tags = [
+            PRODUCT_LIST, product_tag(self.product.pk), category_tag('electronics'), category_tag('books')
+        ]
+
+    def test_product_save_bumps_only_related_tags(self):
+        before = get_generations(self.tags)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = 120
+            self.product.save()
+        after = get_generations(self.tags)
+
+        self.assertNotEqual(before[PRODUCT_LIST], after[PRODUCT_LIST])
+        self.assertNotEqual(before[product_tag(self.product.pk)], after[product_tag(self.product.pk)])
+        self.assertNotEqual(before[category_tag('electronics')], after[category_tag('electronics')])
+        self.assertEqual(before[category_tag('books')], after[category_tag('books')])
+
+    def test_moving_product_invalidates_old_and_new_category(self):
+        before = get_generations(self.tags)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.category = self.books
+            self.product.save()
+        after = get_generations(self.tags)
+
+        self.assertNotEqual(before[category_tag('electronics')], after[category_tag('electronics')])
+        self.assertNotEqual(before[category_tag('books')], after[category_tag('books')])
+
+    def test_stock_reservation_invalidates_product(self):
+        tag = product_tag(self.product.pk)
+        before = get_generations([tag])
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_stock({self.product.pk: 1})
+        self.assertNotEqual(before[tag], get_generations([tag])[tag])
+
+
+@override_settings(CACHES=TEST_CACHES)
+@patch.object(ProductListCreateAPIView, 'throttle_classes', [])
+@patch.object(ProductDetailAPIView, 'throttle_classes', [])
+@patch.object(CategoryViewSet, 'throttle_classes', [])
+@patch.object(OrderViewSet, 'throttle_classes', [])
+@patch.object(CartViewSet, 'throttle_classes', [])
+class ConditionalGetTest(APITestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Electronics', slug='electronics')
+        self.product = Product.objects.create(
+            name='Camera', description='Description', price=100, stock=5, category=self.category
+        )
+        self.user = User.objects.create_user(username='mobile', password='test')
+
+    def assert_revalidates(self, url, **headers):
+        first = self.client.get(url, **headers)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertIn('ETag', first)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'], **headers)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+        self.assertLessEqual(len(app_selects(queries)), 2)
+        return first
+
+    def test_product_detail(self):
+        url = reverse('product-detail', kwargs={'pk': self.product.pk})
+        first = self.assert_revalidates(url)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_stock({self.product.pk: 1})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+
+    def test_product_and_category_lists(self):
+        first = self.assert_revalidates(reverse('products'))
+        self.assert_revalidates(reverse('category-list'))
+        self.assert_revalidates(reverse('category-tree'))
+        self.assertNotEqual(self.client.get(reverse('products'), {'ordering': 'price'})['ETag'], first['ETag'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Books', slug='books')
+        response = self.client.get(reverse('products'), HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_order_detail(self):
+        serializer = OrderCreateSerializer(data={'items': [{'product': self.product.pk, 'quantity': 1}]})
+        serializer.is_valid(raise_exception=True)
+        order = serializer.save(user=self.user)
+        self.client.force_authenticate(self.user)
+        url = reverse('order-detail', kwargs={'pk': order.pk})
+        first = self.assert_revalidates(url)
+
+        Order.objects.filter(pk=order.pk).update(status='Cancelled', updated_at=timezone.now() + timedelta(seconds=5))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.json()['status'], 'Cancelled')
+
+        # Renaming a product changes the item names in the payload
+        Product.objects.filter(pk=self.product.pk).update(name='Renamed', updated_at=timezone.now() + timedelta(seconds=10))
+        renamed = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'], HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(renamed.json()['items'][0]['product_name'], 'Renamed')
+
+        # Other users still get a 404, not a 304
+        self.client.force_authenticate(User.objects.create_user(username='other', password='test'))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 404)
+
+    def test_cart_changes_when_items_change(self):
+        self.client.force_authenticate(self.user)
+        first = self.assert_revalidates(reverse('cart-me'))
+        self.client.post(reverse('cart-add-item'), {'product': self.product.pk, 'quantity': 1}, format='json')
+        response = self.client.get(reverse('cart-me'), HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()['items']), 1)
+
+
+@override_settings(CACHES=TEST_CACHES)
+@patch.object(ProductListCreateAPIView, 'throttle_classes', [])
+@patch.object(OrderViewSet, 'throttle_classes', [])
+class SparseFieldsTest(APITestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Electronics', slug='electronics')
+        self.products = Product.objects.bulk_create(
+            Product(name=f'Camera {i}', description='A long description', price=100 + i, stock=5, category=category)
+            for i in range(8)
+        )
+        self.user = User.objects.create_user(username='grid', password='test', email='grid@example.com')
+        for product in self.products[:3]:
+            serializer = OrderCreateSerializer(data={'items': [{'product': product.pk, 'quantity': 1}]})
+            serializer.is_valid(raise_exception=True)
+            serializer.save(user=self.user)
+
+    def get(self, url, params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+        return response.json(), app_selects(queries)
+
+    def test_product_fields_prune_the_query(self):
+        data, queries = self.get(reverse('products'), {'fields': 'id,name,price,image', 'ordering': 'price', 'size': 5})
+        self.assertEqual(set(data['results'][0]), {'id', 'name', 'price', 'image'})
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('description', queries[0]['sql'])
+        self.assertNotIn('main_category', queries[0]['sql'])
+
+        # The cursor still works off the pruned rows
+        data, queries = self.get(data['next'], {})
+        self.assertEqual([p['price'] for p in data['results']], ['105.00', '106.00', '107.00'])
+        self.assertEqual(len(queries), 1)
+
+    def test_product_omit_and_expand(self):
+        data, _ = self.get(reverse('products'), {'omit': 'description,is_low_stock', 'expand': 'category'})
+        product = data['results'][0]
+        self.assertNotIn('description', product)
+        self.assertNotIn('is_low_stock', product)
+        self.assertEqual(product['category'], {'id': self.products[0].category_id, 'name': 'Electronics', 'slug': 'electronics'})
+        self.assertEqual(product['available_stock'], 4)
+
+        response = self.client.get(reverse('products'), {'fields': 'name,colour'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_order_fields_skip_item_prefetch(self):
+        self.client.force_authenticate(self.user)
+        data, queries = self.get(reverse('order-list'), {'fields': 'order_id,status,total_price'})
+        self.assertEqual(set(data['results'][0]), {'order_id', 'status', 'total_price'})
+        self.assertEqual(sorted(order['total_price'] for order in data['results']), [100, 101, 102])
+        self.assertFalse([q for q in queries if 'FROM "main_product"' in q['sql']])
+
+        data, queries = self.get(reverse('order-list'), {'omit': 'items,total_price', 'expand': 'user'})
+        self.assertEqual(data['results'][0]['user'], {'id': self.user.pk, 'username': 'grid', 'email': 'grid@example.com'})
+        self.assertFalse([q for q in queries if 'main_orderitem' in q['sql']])
+
+        detail = self.client.get(reverse('order-detail', kwargs={'pk': data['results'][0]['order_id']}), {'fields': 'status'})
+        self.assertEqual(detail.json(), {'status': 'Pending'})
+
+
+class FastSerializerParityTest(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Electronics', slug='electronics')
+        self.products = [
+            Product.objects.create(name='Camera', description='Description', price=199.5, stock=5, category=category),
+            Product.objects.create(name='Lens', description='Description', price=40, stock=3, image='products/lens.jpg'),
+            Product.objects.create(name='Bag', description='', price='12.99', stock=30, category=category),
+        ]
+        self.user = User.objects.create_user(username='parity', password='test', email='parity@example.com')
+        for product in self.products[:2]:
+            serializer = OrderCreateSerializer(data={'items': [{'product': product.pk, 'quantity': 2}]})
+            serializer.is_valid(raise_exception=True)
+            serializer.save(user=self.user, shipping_city='Cairo')
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.bulk_create(CartItem(cart=cart, product=p, quantity=i + 1) for i, p in enumerate(self.products))
+
+    def render(self, serializer_class, instance, many=False, **params):
+        request = Request(APIRequestFactory().get('/', params))
+        with override_settings(FAST_READ_SERIALIZERS=False):
+            expected = JSONRenderer().render(serializer_class(instance, many=many, context={'request': request}).data)
+        actual = JSONRenderer().render(serializer_class(instance, many=many, context={'request': request}).data)
+        self.assertEqual(actual, expected)
+        return json.loads(actual)
+
+    def test_output_is_byte_identical(self):
+        products = Product.objects.select_related('category').order_by('pk')
+        data = self.render(ProductSerializer, products, many=True)
+        self.assertNotIn('category_name', data[1])
+        self.assertTrue(data[1]['image'].startswith('http://testserver/'))
+        # In-memory instances still hold unquantized prices, which take DRF's own path
+        self.render(ProductSerializer, self.products, many=True)
+        self.render(ProductSerializer, products, many=True, fields='id,name,price,image', expand='category')
+
+        orders = Order.objects.select_related('user').prefetch_related('items__product').order_by('created_at')
+        self.assertEqual(len(self.render(OrderSerializer, orders, many=True)[0]['items']), 1)
+        self.render(OrderSerializer, orders, many=True, omit='items', expand='user')
+
+        cart = Cart.objects.prefetch_related(Prefetch('items', CartItem.objects.select_related('product'))).get()
+        self.assertEqual(self.render(CartSerializer, cart)['total_items'], 6)
+
+    def test_microbenchmark_reports_per_object_costs(self):
+        costs = benchmarks.serializer_costs(rows=10, repeat=1)
+        self.assertEqual(set(costs), {'product', 'order', 'cart'})
+        self.assertEqual(costs['product']['objects'], 3)
+        self.assertTrue(all(c['drf_us'] > 0 and c['fast_us'] > 0 for c in costs.values()))
+
+
+class FastJSONTest(TestCase):
+    def test_renderer_matches_drf_output(self):
+        payload = {
+            'price': Decimal('19.90'),
+            'order_id': uuid.uuid4(),
+            'created_at': timezone.now(),
+            'date': timezone.now().date(),
+            'name': 'Caf\u00e9 \u2028 \U0001f600',
+            'counts': {1: 2},
+            'items': [{'quantity': 3, 'ratio': 0.1, 'rating': 4.67, 'active': True, 'note': None}],
+            'floats': [0.0, -0.0, 0.0001, 123456789012345.6, 1e15],
+        }
+        self.assertEqual(FastJSONRenderer().render(payload), JSONRenderer().render(payload))
+        for params in ('indent=2', None):
+            media_type = f'application/json; {params}' if params else None
+            self.assertEqual(
+                FastJSONRenderer().render(payload, media_type), JSONRenderer().render(payload, media_type)
+            )
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+    def test_big_integers_use_the_stdlib(self):
+        payload = {'value': 2 ** 70}
+        self.assertEqual(FastJSONRenderer().render(payload), JSONRenderer().render(payload))
+
+    def test_floats_outside_the_shared_range_differ_only_in_spelling(self):
+        for value, rendered in ((1e16, b'1e16'), (1e-05, b'0.00001'), (-2.5e-07, b'-2.5e-7'), (1.5e300, b'1.5e300')):
+            payload = {'value': value}
+            self.assertEqual(FastJSONRenderer().render(payload), b'{"value":%s}' % rendered)
+            self.assertEqual(json.loads(FastJSONRenderer().render(payload)), json.loads(JSONRenderer().render(payload)))
+
+    def test_non_finite_floats_render_as_null(self):
+        for value in (float('nan'), float('-inf'), Decimal('Infinity')):
+            # The stdlib path rejects them under STRICT_JSON
+            with self.assertRaises(ValueError):
+                JSONRenderer().render({'value': value})
+            self.assertEqual(FastJSONRenderer().render({'value': value}), b'{"value":null}')
+
+    def test_parser_round_trips_and_keeps_drf_errors(self):
+        body = FastJSONRenderer().render({'items': [{'product': 1, 'quantity': 2}], 'note': '\u00e9'})
+        self.assertEqual(FastJSONParser().parse(BytesIO(body)), JSONParser().parse(BytesIO(body)))
+        for parser in (FastJSONParser(), JSONParser()):
+            with self.assertRaisesMessage(ParseError, 'JSON parse error'):
+                parser.parse(BytesIO(b'{"items": ['))
+
+    def test_api_uses_fast_json(self):
+        user = User.objects.create_user(username='json', password='test')
+        product = Product.objects.create(name='Camera', description='Description', price='199.50', stock=5)
+        self.client.force_login(user)
+        response = self.client.post(
+            reverse('order-list'), {'items': [{'product': str(product.pk), 'quantity': 1}]},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.content)
+        self.assertIsInstance(response.accepted_renderer, FastJSONRenderer)
+        self.assertEqual(response.content, JSONRenderer().render(response.data))
+
+    def test_microbenchmark_reports_identical_output(self):
+        Product.objects.create(name='Camera', description='Description', price='199.50', stock=5)
+        costs = benchmarks.renderer_costs(rows=10, repeat=1)
+        self.assertEqual(costs['product']['objects'], 1)
+        self.assertTrue(all(c['identical'] for c in costs.values()))
+
+
+class CacheResponseTest(TestCase):
+    def setUp(self):
+        self.prefix = f'test-{uuid.uuid4().hex}'
+        self.tag = f'{self.prefix}-tag'
+        self.calls = 0
+
+        @cache_response(self.prefix, lambda request: [self.tag], fresh_for=60, wait_for=0)
+        def view(request):
+            self.calls += 1
+            return Response({'calls': self.calls})
+
+        self.view = view
+        self.request = Request(APIRequestFactory().get(f'/api/{self.prefix}/'))
+
+    def test_hit_after_miss(self):
+        self.assertEqual(self.view(self.request)[CACHE_HEADER], 'MISS')
+        response = self.view(self.request)
+        self.assertEqual(response[CACHE_HEADER], 'HIT')
+        self.assertEqual((response.data, self.calls), ({'calls': 1}, 1))
+
+    def test_invalidated_entry_is_served_stale_while_another_request_recomputes(self):
+        self.view(self.request)
+        bump(self.tag)
+
+        # Simulate a concurrent request already holding the recompute lock
+        path_hash = hashlib.md5(self.request.get_full_path().encode()).hexdigest()
+        cache.add(f'response:{self.prefix}:{path_hash}:lock', 1)
+        response = self.view(self.request)
+        self.assertEqual(response[CACHE_HEADER], 'STALE')
+        self.assertEqual(self.calls, 1)
+
+        cache.delete(f'response:{self.prefix}:{path_hash}:lock')
+        response = self.view(self.request)
+        self.assertEqual(response[CACHE_HEADER], 'MISS')
+        self.assertEqual(response.data, {'calls': 2})
+        self.assertEqual(get_stats([self.prefix])[self.prefix], {'hit': 0, 'miss': 2, 'stale': 1})
+
+
+class ProductSearchTest(TestCase):
+    def setUp(self):
+        self.camera = Product.objects.create(
+            name='Digital Camera', description='Compact and light', price=300, stock=5
+        )
+        self.bag = Product.objects.create(
+            name='Travel Bag', description='Fits a digital camera and two lenses', price=40, stock=5
+        )
+        Product.objects.create(name='Blender', description='Kitchen helper', price=60, stock=5)
+
+    def search(self, query):
+        return list(search_products(Product.objects.all(), query).order_by('-search_rank', 'pk'))
+
+    def test_matches_are_ranked_by_relevance(self):
+        self.assertEqual(self.search('camera'), [self.camera, self.bag])
+
+    def test_index_follows_product_writes(self):
+        Product.objects.filter(pk=self.bag.pk).update(description='Fits two lenses')
+        self.assertEqual(self.search('camera'), [self.camera])
+
+        self.camera.name = 'Mirrorless Body'
+        self.camera.description = 'Compact'
+        self.camera.save()
+        self.assertEqual(self.search('camera'), [])
+        self.assertEqual(self.search('mirrorless'), [self.camera])
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.assertEqual(self.search('"camera(:'), [self.camera, self.bag])
+        self.assertEqual(self.search('*'), [])
+
+    def test_match_runs_once_per_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.search('camera')
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(queries[0]['sql'].count('MATCH'), 1)
+
+    @patch.object(ProductListCreateAPIView, 'throttle_classes', [])
+    def test_results_page_by_relevance(self):
+        response = self.client.get(reverse('products'), {'q': 'camera', 'size': 1})
+        self.assertEqual([p['id'] for p in response.json()['results']], [self.camera.pk])
+
+        response = self.client.get(response.json()['next'])
+        self.assertEqual([p['id'] for p in response.json()['results']], [self.bag.pk])
+        self.assertIsNone(response.json()['next'])
+
+
+@patch.object(ProductInfoAPIView, 'throttle_classes', [])
+class ProductInfoAPITest(APITestCase):
+    def setUp(self):
+        self.products = [
+            Product.objects.create(name=f'Product {i}', description='Description', price=10 + i, stock=5)
+            for i in range(7)
+        ]
+        Product.objects.create(name='Hidden', description='Description', price=999, stock=5, is_active=False)
+        self.url = reverse('product-info')
+        # Signal-driven invalidation only runs on commit, which TestCase never does
+        bump(PRODUCT_LIST)
+
+    def test_summary_only(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'include': 'summary'})
+        self.assertEqual(response.json(), {'count': 7, 'max_price': 16.0})
+        self.assertEqual(len(app_selects(queries)), 1)
+
+    def test_streamed_json_dump(self):
+        with patch.object(ProductInfoAPIView, 'chunk_size', 3):
+            response = self.client.get(self.url)
+            body = json.loads(b''.join(response.streaming_content))
+
+        self.assertEqual((body['count'], body['max_price']), (7, 16.0))
+        self.assertEqual([p['id'] for p in body['products']], [p.pk for p in self.products])
+
+    def test_streamed_ndjson_dump(self):
+        response = self.client.get(self.url, {'format': 'ndjson'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(json.loads(lines[0]), {'count': 7, 'max_price': 16.0})
+        self.assertEqual(len(lines), 8)
+
+    def test_summary_and_errors_render_as_ndjson(self):
+        response = self.client.get(self.url, {'include': 'summary', 'format': 'ndjson'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(response.content, b'{"count":7,"max_price":16.0}\n')
+
+        response = self.client.post(self.url, HTTP_ACCEPT='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+        self.assertEqual(json.loads(response.content), {'detail': 'Method "POST" not allowed.'})
+
+
+@patch.object(CategoryViewSet, 'throttle_classes', [])
+class CategoryAPITest(APITestCase):
+    def setUp(self):
+        self.electronics = Category.objects.create(name='Electronics', slug='electronics')
+        self.cameras = Category.objects.create(name='Cameras', slug='cameras', parent=self.electronics)
+        self.books = Category.objects.create(name='Books', slug='books')
+        Product.objects.create(name='Camera', description='Description', price=100, stock=5, category=self.cameras)
+        Product.objects.create(name='Old Camera', description='Description', price=50, stock=0, category=self.cameras)
+        Product.objects.create(
+            name='Retired Camera', description='Description', price=20, stock=5, category=self.cameras, is_active=False
+        )
+        bump(CATALOG)
+
+    def test_list_counts_products_in_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('category-list'), {'size': 50})
+        counts = {c['slug']: c['products_count'] for c in response.json()['results']}
+        self.assertEqual(counts, {'books': 0, 'cameras': 3, 'electronics': 0})
+        self.assertEqual(list(counts), ['books', 'cameras', 'electronics'])
+        # One page query plus the paginator's COUNT
+        self.assertEqual(len(app_selects(queries)), 2)
+
+        response = self.client.get(reverse('category-list'), {'in_stock_only': 'true'})
+        counts = {c['slug']: c['products_count'] for c in response.json()['results']}
+        self.assertEqual(counts['cameras'], 1)
+
+    def test_tree_is_nested(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('category-tree'), {'active_only': 'true'})
+        self.assertEqual(len(app_selects(queries)), 1)
+        self.assertEqual(response.json(), [
+            {'id': self.books.pk, 'name': 'Books', 'slug': 'books', 'products_count': 0, 'children': []},
+            {'id': self.electronics.pk, 'name': 'Electronics', 'slug': 'electronics', 'products_count': 0, 'children': [
+                {'id': self.cameras.pk, 'name': 'Cameras', 'slug': 'cameras', 'products_count': 2, 'children': []},
+            ]},
+        ])
+
+
+class CategoryPathTest(TestCase):
+    def setUp(self):
+        self.electronics = Category.objects.create(name='Electronics', slug='electronics')
+        self.cameras = Category.objects.create(name='Cameras', slug='cameras', parent=self.electronics)
+        self.lenses = Category.objects.create(name='Lenses', slug='lenses', parent=self.cameras)
+        self.books = Category.objects.create(name='Books', slug='books')
+        self.lens = Product.objects.create(name='Lens', description='Description', price=100, stock=5, category=self.lenses)
+        self.tv = Product.objects.create(name='TV', description='Description', price=500, stock=5, category=self.electronics)
+        self.novel = Product.objects.create(name='Novel', description='Description', price=10, stock=5, category=self.books)
+
+    def filter(self, **params):
+        return set(ProductFilter(params, queryset=Product.objects.all()).qs)
+
+    def test_paths_follow_hierarchy(self):
+        self.assertEqual(self.lenses.path, f'/{self.electronics.pk}/{self.cameras.pk}/{self.lenses.pk}/')
+
+    def test_descendant_filter_resolves_the_subtree_first(self):
+        self.assertEqual(self.filter(category='electronics'), {self.tv})
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.filter(category='electronics', descendants='true'), {self.tv, self.lens})
+        category_lookup, subtree_lookup, product_query = app_selects(queries)
+        self.assertIn(f"LIKE '{self.electronics.path}%'", subtree_lookup['sql'])
+        # Products are filtered on constant category ids, without a join or subquery
+        self.assertNotIn('main_category', product_query['sql'])
+        self.assertEqual(self.filter(category=str(self.cameras.pk), descendants='true'), {self.lens})
+        self.assertEqual(self.filter(category='missing', descendants='true'), set())
+
+    def test_moving_a_category_reroots_its_subtree(self):
+        self.cameras.parent = self.books
+        self.cameras.save()
+        self.lenses.refresh_from_db()
+        self.assertEqual(self.lenses.path, f'/{self.books.pk}/{self.cameras.pk}/{self.lenses.pk}/')
+        self.assertEqual(self.filter(category_slug='books', descendants='true'), {self.novel, self.lens})
+
+        with self.assertRaises(ValueError):
+            self.books.parent = self.lenses
+            self.books.save()
+
+
+@patch.object(CartViewSet, 'throttle_classes', [])
+class CartQueryCountTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='shopper', password='test')
+        self.client.force_authenticate(self.user)
+        self.cart = Cart.objects.create(user=self.user)
+        self.products = [
+            Product.objects.create(name=f'Product {i}', description='Description', price=10 + i, stock=20)
+            for i in range(11)
+        ]
+        self.extra = self.products.pop()
+
+    def fill(self, count):
+        self.cart.items.all().delete()
+        CartItem.objects.bulk_create(CartItem(cart=self.cart, product=p, quantity=2) for p in self.products[:count])
+
+    def count_queries(self, count, method, name, data=None):
+        self.fill(count)
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(reverse(name), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(app_queries(queries))
+
+    def test_totals_come_from_one_aggregate(self):
+        self.fill(3)
+        cart = Cart.objects.get(pk=self.cart.pk)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(cart.total_price, 2 * (10 + 11 + 12))
+            self.assertEqual(cart.total_items, 6)
+        self.assertEqual(len(app_queries(queries)), 1)
+
+    def test_cart_actions_do_not_scale_with_item_count(self):
+        actions = [
+            ('get', 'cart-me', None),
+            ('post', 'cart-add-item', lambda: {'product': self.extra.pk, 'quantity': 1}),
+            ('put', 'cart-update-item', lambda: {'product': self.products[0].pk, 'quantity': 3}),
+            ('delete', 'cart-remove-item', lambda: {'product': self.products[0].pk}),
+            ('delete', 'cart-clear', None),
+        ]
+        for method, name, data in actions:
+            with self.subTest(action=name):
+                small = self.count_queries(1, method, name, data and data())
+                large = self.count_queries(10, method, name, data and data())
+                self.assertEqual(small, large)
+
+    def test_mutation_response_reflects_new_totals(self):
+        self.fill(2)
+        response = self.client.put(
+            reverse('cart-update-item'), {'product': self.products[0].pk, 'quantity': 5}, format='json'
+        )
+        self.assertEqual(response.json()['total_items'], 7)
+        self.assertEqual(float(response.json()['total_price']), 5 * 10 + 2 * 11)
+
+    def test_batch_endpoint_applies_every_line_at_once(self):
+        self.fill(3)
+        lines = [
+            {'product': self.products[0].pk, 'quantity': 0},
+            {'product': self.products[1].pk, 'quantity': 4},
+            {'product': self.extra.pk, 'quantity': 1},
+        ]
+        response = self.client.patch(reverse('cart-items'), {'items': lines}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        quantities = {item['product']: item['quantity'] for item in response.json()['items']}
+        self.assertEqual(quantities, {self.products[1].pk: 4, self.products[2].pk: 2, self.extra.pk: 1})
+
+        many = [{'product': p.pk, 'quantity': 1} for p in self.products]
+        self.assertEqual(
+            self.count_queries(1, 'patch', 'cart-items', many[:2]),
+            self.count_queries(1, 'patch', 'cart-items', many),
+        )
+
+    def test_batch_endpoint_is_all_or_nothing(self):
+        self.fill(1)
+        lines = [{'product': self.extra.pk, 'quantity': 1}, {'product': self.products[1].pk, 'quantity': 99}]
+        response = self.client.patch(reverse('cart-items'), {'items': lines}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(list(self.cart.items.values_list('product_id', flat=True)), [self.products[0].pk])
+
+    def test_checkout_converts_cart_in_a_bounded_number_of_queries(self):
+        UserProfile.objects.filter(user=self.user).update(shipping_city='Cairo')
+
+        def checkout(count):
+            self.fill(count)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(reverse('cart-checkout'), {'shipping_country': 'Egypt'}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            return response.json(), len(app_queries(queries))
+
+        _, small = checkout(1)
+        order, large = checkout(10)
+        self.assertEqual(small, large)
+        self.assertEqual(len(order['items']), 10)
+        self.assertEqual(order['shipping_city'], 'Cairo')
+        self.assertFalse(self.cart.items.exists())
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).reserved_stock, 4)
+
+    def test_checkout_rejects_empty_cart_and_stock_shortfalls(self):
+        response = self.client.post(reverse('cart-checkout'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        CartItem.objects.create(cart=self.cart, product=self.extra, quantity=2)
+        Product.objects.filter(pk=self.extra.pk).update(reserved_stock=19)
+        response = self.client.post(reverse('cart-checkout'))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertTrue(self.cart.items.exists())
+        self.assertFalse(Order.objects.exists())
+
+
+@override_settings(ANONYMOUS_CARTS=True)
+@patch.object(CartViewSet, 'throttle_classes', [])
+class SessionCartTest(APITestCase):
+    def setUp(self):
+        self.camera = Product.objects.create(name='Camera', description='Description', price=100, stock=5)
+        self.lens = Product.objects.create(name='Lens', description='Description', price=40, stock=3)
+        self.user = User.objects.create_user(username='shopper', password='test')
+
+    def test_anonymous_cart_never_touches_the_database(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('cart-add-item'), {'product': self.camera.pk, 'quantity': 2}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse([q for q in app_queries(queries) if q['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))])
+        token = response[CART_TOKEN_HEADER]
+
+        response = self.client.patch(
+            reverse('cart-items'), [{'product': self.lens.pk, 'quantity': 1}], format='json', HTTP_X_CART_TOKEN=token
+        )
+        self.assertEqual(response.json()['total_items'], 3)
+        self.assertEqual(float(response.json()['total_price']), 240)
+        self.assertFalse(Cart.objects.exists())
+
+    def test_cart_is_merged_on_first_authenticated_request(self):
+        session_cart = SessionCart()
+        session_cart.update({self.camera.pk: 2, self.lens.pk: 3})
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.lens, quantity=2)
+
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(reverse('cart-me'), HTTP_X_CART_TOKEN=session_cart.token)
+        quantities = {item['product']: item['quantity'] for item in response.json()['items']}
+        # Merged quantities are capped at the available stock
+        self.assertEqual(quantities, {self.camera.pk: 2, self.lens.pk: 3})
+        self.assertEqual(session_cart.lines(), {})
+
+    def test_idempotency_key_needs_a_cart_token(self):
+        url, data = reverse('cart-add-item'), {'product': self.camera.pk, 'quantity': 1}
+        response = self.client.post(url, data, format='json', HTTP_IDEMPOTENCY_KEY='add-1')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        token = self.client.get(reverse('cart-me'))[CART_TOKEN_HEADER]
+        first = self.client.post(url, data, format='json', HTTP_IDEMPOTENCY_KEY='add-1', HTTP_X_CART_TOKEN=token)
+        retry = self.client.post(url, data, format='json', HTTP_IDEMPOTENCY_KEY='add-1', HTTP_X_CART_TOKEN=token)
+        self.assertEqual(retry[REPLAYED_HEADER], 'true')
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(SessionCart(token).lines(), {self.camera.pk: 1})
+
+        # Another client's key of the same name doesn't see this cart
+        other = self.client.post(url, data, format='json', HTTP_IDEMPOTENCY_KEY='add-1',
+                                 HTTP_X_CART_TOKEN=SessionCart().token)
+        self.assertNotIn(REPLAYED_HEADER, other)
+
+    @override_settings(ANONYMOUS_CARTS=False)
+    def test_anonymous_carts_can_be_switched_off(self):
+        response = self.client.post(reverse('cart-add-item'), {'product': self.camera.pk, 'quantity': 1}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@patch.object(CartViewSet, 'throttle_classes', [])
+class IdempotencyKeyTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='retrier', password='test')
+        self.client.force_authenticate(self.user)
+        self.product = Product.objects.create(name='Camera', description='Description', price=100, stock=5)
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2)
+
+    def checkout(self, key, **data):
+        return self.client.post(reverse('cart-checkout'), data, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def assert_retries_replay_the_first_response(self):
+        first = self.checkout('checkout-1')
+        retry = self.checkout('checkout-1')
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry[REPLAYED_HEADER], 'true')
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).reserved_stock, 2)
+
+        # Reusing the key for a different payload is rejected
+        self.assertEqual(self.checkout('checkout-1', shipping_city='Giza').status_code, 422)
+
+    def test_retried_checkout_is_replayed_from_the_cache(self):
+        self.assert_retries_replay_the_first_response()
+        self.assertFalse(IdempotencyRecord.objects.exists())
+
+    @override_settings(IDEMPOTENCY_STORE='db')
+    def test_retried_checkout_is_replayed_from_the_database(self):
+        self.assert_retries_replay_the_first_response()
+        self.assertEqual(IdempotencyRecord.objects.get().status_code, 201)
+
+    def test_expired_records_are_purged_periodically(self):
+        old = IdempotencyRecord.objects.create(key='old', fingerprint='f', status_code=201)
+        IdempotencyRecord.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=2))
+        IdempotencyRecord.objects.create(key='new', fingerprint='f', status_code=201)
+
+        self.assertEqual(purge_idempotency_records(), 'Deleted 1 expired idempotency records')
+        self.assertEqual(list(IdempotencyRecord.objects.values_list('key', flat=True)), ['new'])
+        self.assertIn('main.tasks.purge_idempotency_records',
+                      [entry['task'] for entry in settings.CELERY_BEAT_SCHEDULE.values()])
+
+    def test_failed_requests_release_the_key(self):
+        response = self.client.post(reverse('cart-add-item'), {'product': self.product.pk, 'quantity': 10},
+                                    format='json', HTTP_IDEMPOTENCY_KEY='add-1')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(reverse('cart-add-item'), {'product': self.product.pk, 'quantity': 10},
+                                    format='json', HTTP_IDEMPOTENCY_KEY='add-1')
+        self.assertNotIn(REPLAYED_HEADER, response)
+
+
+def full_scans(sql):
+    """Tables of this app that the database plans to read in full, without an index."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'EXPLAIN {sql}')
+            return re.findall(r'Seq Scan on (main_\w+)', '\n'.join(row[0] for row in cursor.fetchall()))
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        plan = [row[-1] for row in cursor.fetchall()]
+    # SQLite reports a table walk as "SCAN <table>" (index-driven ones add "USING ... INDEX")
+    tables = [m.group(1) for step in plan for m in [re.match(r'SCAN (main_\w+)$', step)] if m]
+    return [table for table in tables if not stops_at_limit(sql, plan, table)]
+
+
+def stops_at_limit(sql, plan, table):
+    """
+    Whether a walk over ``table`` in pk order ends after LIMIT rows. That holds when nothing has to be
+    sorted first and the query filters on nothing but the condition of one of the table's partial
+    indexes (the active rows every listing is built on). Any other predicate can leave the walk
+    skipping row after row, so filtered queries have to reach the table through an index instead.
+    """
+    if ' LIMIT ' not in sql or any(step.startswith('USE TEMP B-TREE') for step in plan):
+        return False
+    where = re.search(r' WHERE (.+?) (?:ORDER BY|LIMIT) ', sql)
+    if where is None:
+        return True
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = %s", [table])
+        conditions = {row[0].partition(' WHERE ')[2] for row in cursor.fetchall() if row[0] and ' WHERE ' in row[0]}
+    return where.group(1).replace(f'"{table}".', '') in conditions
+
+
+@override_settings(CACHES=TEST_CACHES)
+@patch.object(ProductListCreateAPIView, 'throttle_classes', [])
+@patch.object(UserOrderListAPIView, 'throttle_classes', [])
+@patch.object(OrderViewSet, 'throttle_classes', [])
+@patch.object(ReviewViewSet, 'throttle_classes', [])
+class QueryPlanTest(APITestCase):
+    """
+    Runs every list endpoint against a seeded dataset and EXPLAINs the queries
+    it issued, failing if any of them falls back to a sequential scan.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        call_command('seed_data', products=10000, users=300, orders=10000, reviews=10000, categories=60, seed=17,
+                     stdout=StringIO())
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        cls.user = User.objects.annotate(order_count=Count('orders')).order_by('-order_count').first()
+        cls.category = Category.objects.filter(parent__isnull=False, subcategories__isnull=False).first()
+        cls.product = Product.objects.order_by('-rating_count').first()
+
+    def assert_no_full_scans(self, url, params=None, user=None):
+        # A cached response issues no queries to check
+        bump(CATALOG, ORDERS, *([order_tag(user.pk)] if user else []))
+        self.client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(app_selects(queries), 'served from the cache')
+        for query in app_selects(queries):
+            self.assertEqual(full_scans(query['sql']), [], query['sql'])
+
+    def test_product_list(self):
+        self.assert_no_full_scans(reverse('products'))
+        self.assert_no_full_scans(reverse('products'), {'category': self.category.pk})
+        self.assert_no_full_scans(reverse('products'), {'category': self.category.slug, 'descendants': 'true'})
+        self.assert_no_full_scans(reverse('products'), {'ordering': 'price', 'min_price': 100})
+        self.assert_no_full_scans(reverse('products'), {'ordering': '-created_at'})
+
+    def test_order_lists(self):
+        self.assert_no_full_scans(reverse('user-orders'), user=self.user)
+        self.assert_no_full_scans(reverse('order-list'), user=self.user)
+        self.assert_no_full_scans(reverse('order-list'), {'status': 'Pending'}, user=self.user)
+
+    def test_review_list(self):
+        self.assert_no_full_scans(reverse('review-list'), {'product': self.product.pk})
+        self.assert_no_full_scans(reverse('review-list'))
+
+    def test_filtered_walks_are_not_treated_as_bounded(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('PostgreSQL plans are checked for any Seq Scan')
+        active = Product.objects.filter(is_active=True).order_by('pk')
+        self.assertEqual(full_scans(str(active[:10].query)), [])
+        self.assertEqual(full_scans(str(active.filter(stock__gt=0)[:10].query)), ['main_product'])
+        self.assertEqual(full_scans(str(Review.objects.order_by('pk')[:10].query)), [])
+        self.assertEqual(full_scans(str(Review.objects.filter(rating=1).order_by('pk')[:10].query)), ['main_review'])
@@ -8,6 +8,7 @@ urlpatterns = [
     path('products/', views.ProductListCreateAPIView.as_view(), name='products'),
     path('products/<int:pk>/', views.ProductDetailAPIView.as_view(), name='product-detail'),
     path('product/info/', views.ProductInfoAPIView.as_view(), name='product-info'),
+    path('cache/stats/', views.CacheStatsAPIView.as_view(), name='cache-stats'),
     
     # Users
     path('users/', views.UserListView.as_view(), name='user-list'),
@@ -1,5 +1,8 @@
-from django.db.models import Max
-from django.http import JsonResponse
+import json
+from itertools import islice
+
+from django.db.models import Count, F, Max, Prefetch, Q
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render
 # The method reverse is used to get the URL of a view by its name
 from django.urls import reverse
@@ -7,26 +10,64 @@ from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.decorators import action
 from rest_framework import filters, generics, viewsets, status
 from rest_framework.decorators import api_view
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 
 from .filters import InStockFilterBackend, OrderFilter, ProductFilter
+from .carts import (
+    CART_TOKEN_COOKIE, CART_TOKEN_HEADER, SessionCart, cart_ttl, get_cart_token, merge_session_cart,
+    session_carts_enabled,
+)
+from .caching import (
+    cache_response, category_tree_tags, get_stats, order_list_tags, product_detail_tags, product_info_tags,
+    product_list_tags, user_order_tags
+)
+from .conditional import (
+    cart_validators, category_validators, conditional, order_validators, product_detail_validators,
+    product_list_validators,
+)
+from .exceptions import Conflict
+from .idempotency import idempotent
+from .inventory import consume_stock, quantities_by_product, release_stock
+from .pagination import KeysetPagination
+from .renderers import FastJSONRenderer, NDJSONRenderer
+from .search import FullTextSearchFilter
 from .models import Order, OrderItem, Product, User, UserProfile, Category, Review, Cart, CartItem
 from .serializers import (
     OrderSerializer, ProductSerializer, OrderCreateSerializer, UserSerializer,
     UserProfileSerializer, CategorySerializer, ReviewSerializer, CartSerializer,
-    CartItemSerializer, ProductInfoSerializer
+    CartItemSerializer, CartBatchSerializer, CartCheckoutSerializer, ProductInfoSerializer
 )
 from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
-from django.views.decorators.vary import vary_on_headers 
 from rest_framework.throttling import ScopedRateThrottle
 from main.tasks import send_order_confirmation_email
 from django.db import transaction
 
 
+class SparseFieldsQuerysetMixin:
+    """Prune the queryset of a read to the fields picked with ``?fields=``/``?omit=``/``?expand=``."""
+    
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.request.method not in ('GET', 'HEAD'):
+            return queryset
+        serializer = self.get_serializer()
+        if not getattr(serializer, 'sparse', False):
+            return queryset
+        # Keyset pagination reads the ordering columns back from the last row
+        ordering = list(queryset.query.order_by)
+        if hasattr(self.paginator, 'get_ordering'):
+            ordering += self.paginator.get_ordering(self.request, queryset, self)
+        keep = {
+            name.lstrip('-') for name in ordering
+            if isinstance(name, str) and name.lstrip('-') not in queryset.query.annotations
+        }
+        return serializer.prune_queryset(queryset, keep=keep)
+
+
 # User Profile ViewSet
 class UserProfileViewSet(viewsets.ModelViewSet):
     queryset = UserProfile.objects.all()
@@ -60,6 +101,41 @@ class CategoryViewSet(viewsets.ModelViewSet):
     permission_classes = [AllowAny]
     lookup_field = 'slug'
     
+    def get_queryset(self):
+        # GROUP BY queries ignore Meta.ordering, so restate it for stable pages
+        return Category.objects.annotate(products_count=self.get_products_count()).order_by(*Category._meta.ordering)
+    
+    def get_products_count(self):
+        """Count of products per category, optionally only active (``active_only``) or in stock (``in_stock_only``)"""
+        condition = Q()
+        if self.request.query_params.get('active_only', '').lower() == 'true':
+            condition &= Q(products__is_active=True)
+        if self.request.query_params.get('in_stock_only', '').lower() == 'true':
+            condition &= Q(products__is_active=True, products__stock__gt=F('products__reserved_stock'))
+        return Count('products', filter=condition or None)
+    
+    @method_decorator(conditional(category_validators))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
+    @method_decorator(conditional(category_validators))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+    
+    @action(detail=False, methods=['get'])
+    @method_decorator(conditional(category_validators))
+    @method_decorator(cache_response('category_tree', category_tree_tags, fresh_for=60*60))
+    def tree(self, request):
+        """Full category hierarchy with product counts, built from a single query"""
+        categories = self.get_queryset().order_by('name').values('id', 'name', 'slug', 'parent_id', 'products_count')
+        
+        nodes = {category['id']: {**category, 'children': []} for category in categories}
+        roots = []
+        for node in nodes.values():
+            parent = nodes.get(node.pop('parent_id'))
+            (parent['children'] if parent else roots).append(node)
+        return Response(roots)
+    
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
             return [IsAdminUser()]
@@ -74,6 +150,8 @@ class ReviewViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['product', 'rating']
     ordering_fields = ['created_at', 'rating']
+    ordering = ('-created_at',)
+    pagination_class = KeysetPagination
     
     def get_queryset(self):
         queryset = Review.objects.select_related('user', 'product')
@@ -98,27 +176,114 @@ class CartViewSet(viewsets.ModelViewSet):
     queryset = Cart.objects.prefetch_related('items__product')
     serializer_class = CartSerializer
     permission_classes = [IsAuthenticated]
+    # Actions anonymous clients may use on a cache-backed cart when ANONYMOUS_CARTS is on
+    session_cart_actions = ('me', 'add_item', 'update_item', 'remove_item', 'batch_items', 'clear')
+    session_cart = None
     
     def get_queryset(self):
-        return Cart.objects.filter(user=self.request.user).prefetch_related('items__product')
+        return Cart.objects.filter(user=self.request.user).prefetch_related(
+            Prefetch('items', queryset=CartItem.objects.select_related('product'))
+        )
+    
+    def get_permissions(self):
+        if self.action in self.session_cart_actions and session_carts_enabled():
+            return [AllowAny()]
+        return super().get_permissions()
+    
+    def get_throttles(self):
+        # Checkout creates an order, so it shares the order endpoints' rate
+        if self.action == 'checkout':
+            self.throttle_scope = 'orders'
+        return super().get_throttles()
+    
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        token = get_cart_token(request)
+        if request.user.is_authenticated:
+            # Logging in folds the anonymous cart into the user's cart
+            if token and session_carts_enabled():
+                merge_session_cart(token, request.user)
+                self.session_cart = SessionCart(token)
+        elif self.action in self.session_cart_actions:
+            self.session_cart = SessionCart(token)
+    
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.session_cart is not None:
+            if request.user.is_authenticated:
+                response.delete_cookie(CART_TOKEN_COOKIE)
+            else:
+                response[CART_TOKEN_HEADER] = self.session_cart.token
+                response.set_cookie(CART_TOKEN_COOKIE, self.session_cart.token, max_age=cart_ttl(), httponly=True, samesite='Lax')
+        return response
+    
+    @property
+    def is_session_cart(self):
+        return not self.request.user.is_authenticated
+    
+    @staticmethod
+    def session_product_id(value):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise ValidationError({'product': 'A valid integer is required.'})
+    
+    def cart_response(self, request):
+        """Serialize the user's cart from a single prefetched load (cart + items joined with products)"""
+        if self.is_session_cart:
+            return self.session_cart_response()
+        
+        cart = self.get_queryset().first()
+        if cart is None:
+            cart = Cart.objects.create(user=request.user)
+        return Response(CartSerializer(cart).data, status=status.HTTP_200_OK)
+    
+    def session_cart_response(self):
+        """Serialize an anonymous cart in the same shape as CartSerializer, loading its products in one query"""
+        lines = self.session_cart.lines()
+        products = Product.objects.in_bulk(list(lines))
+        items = [
+            CartItem(product=products[pk], quantity=quantity)
+            for pk, quantity in lines.items() if pk in products
+        ]
+        return Response({
+            'id': None,
+            'user': None,
+            'items': CartItemSerializer(items, many=True).data,
+            'total_price': sum(item.subtotal for item in items),
+            'total_items': sum(item.quantity for item in items),
+            'created_at': None,
+            'updated_at': None,
+        }, status=status.HTTP_200_OK)
     
     @action(detail=False, methods=['get'])
+    @method_decorator(conditional(cart_validators))
     def me(self, request):
         """Get current user's cart"""
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        serializer = self.get_serializer(cart)
-        return Response(serializer.data)
+        return self.cart_response(request)
     
     @action(detail=False, methods=['post'])
+    @method_decorator(idempotent('cart_add_item'))
     def add_item(self, request):
         """Add item to cart"""
-        cart, created = Cart.objects.get_or_create(user=request.user)
         serializer = CartItemSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
         product = serializer.validated_data['product']
         quantity = serializer.validated_data['quantity']
         
+        if self.is_session_cart:
+            current = self.session_cart.lines().get(product.pk, 0)
+            if current + quantity > product.available_stock:
+                return Response(
+                    {'error': f'Only {product.available_stock} items available in stock.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            self.session_cart.add(product.pk, quantity)
+            return self.cart_response(request)
+        
+        cart, created = Cart.objects.get_or_create(user=request.user)
+        
         # Check if item already exists in cart
         cart_item, created = CartItem.objects.get_or_create(
             cart=cart,
@@ -136,15 +301,14 @@ class CartViewSet(viewsets.ModelViewSet):
                     {'error': f'Only {product.available_stock} items available in stock.'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            cart_item.save()
+            cart_item.save(update_fields=['quantity'])
         
-        cart_serializer = CartSerializer(cart)
-        return Response(cart_serializer.data, status=status.HTTP_200_OK)
+        return self.cart_response(request)
     
     @action(detail=False, methods=['put'])
+    @method_decorator(idempotent('cart_update_item'))
     def update_item(self, request):
         """Update cart item quantity"""
-        cart = get_object_or_404(Cart, user=request.user)
         product_id = request.data.get('product')
         quantity = request.data.get('quantity')
         
@@ -154,7 +318,25 @@ class CartViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        cart_item = get_object_or_404(CartItem, cart=cart, product_id=product_id)
+        if self.is_session_cart:
+            product_id = self.session_product_id(product_id)
+            if product_id not in self.session_cart.lines():
+                raise Http404('No CartItem matches the given query.')
+            if quantity <= 0:
+                self.session_cart.remove(product_id)
+                return Response({'message': 'Item removed from cart'}, status=status.HTTP_200_OK)
+            product = get_object_or_404(Product, pk=product_id)
+            if quantity > product.available_stock:
+                return Response(
+                    {'error': f'Only {product.available_stock} items available in stock.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            self.session_cart.update({product.pk: quantity})
+            return self.cart_response(request)
+        
+        cart_item = get_object_or_404(
+            CartItem.objects.select_related('product'), cart__user=request.user, product_id=product_id
+        )
         
         if quantity <= 0:
             cart_item.delete()
@@ -168,15 +350,14 @@ class CartViewSet(viewsets.ModelViewSet):
             )
         
         cart_item.quantity = quantity
-        cart_item.save()
+        cart_item.save(update_fields=['quantity'])
         
-        cart_serializer = CartSerializer(cart)
-        return Response(cart_serializer.data)
+        return self.cart_response(request)
     
     @action(detail=False, methods=['delete'])
+    @method_decorator(idempotent('cart_remove_item'))
     def remove_item(self, request):
         """Remove item from cart"""
-        cart = get_object_or_404(Cart, user=request.user)
         product_id = request.data.get('product')
         
         if not product_id:
@@ -185,23 +366,58 @@ class CartViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        cart_item = get_object_or_404(CartItem, cart=cart, product_id=product_id)
-        cart_item.delete()
+        if self.is_session_cart:
+            deleted = self.session_cart.remove(self.session_product_id(product_id))
+        else:
+            deleted, _ = CartItem.objects.filter(cart__user=request.user, product_id=product_id).delete()
+        if not deleted:
+            raise Http404('No CartItem matches the given query.')
+        
+        return self.cart_response(request)
+    
+    @action(detail=False, methods=['patch'], url_path='items', url_name='items')
+    @method_decorator(idempotent('cart_batch_items'))
+    def batch_items(self, request):
+        """Upsert or remove many cart lines in one request (quantity 0 removes a line)"""
+        data = {'items': request.data} if isinstance(request.data, list) else request.data
+        serializer = CartBatchSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        
+        if self.is_session_cart:
+            self.session_cart.update({line['product'].pk: line['quantity'] for line in serializer.validated_data['items']})
+        else:
+            cart, created = Cart.objects.get_or_create(user=request.user)
+            serializer.save(cart)
         
-        cart_serializer = CartSerializer(cart)
-        return Response(cart_serializer.data)
+        return self.cart_response(request)
+    
+    @action(detail=False, methods=['post'])
+    @method_decorator(idempotent('cart_checkout'))
+    def checkout(self, request):
+        """Convert the cart into an order: reserve stock, snapshot prices and empty the cart in one transaction"""
+        serializer = CartCheckoutSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        order = serializer.save(request.user)
+        
+        transaction.on_commit(lambda: send_order_confirmation_email.delay(str(order.order_id), request.user.email))
+        
+        order = Order.objects.prefetch_related('items__product').get(pk=order.pk)
+        return Response(OrderSerializer(order).data, status=status.HTTP_201_CREATED)
     
     @action(detail=False, methods=['delete'])
+    @method_decorator(idempotent('cart_clear'))
     def clear(self, request):
         """Clear all items from cart"""
-        cart = get_object_or_404(Cart, user=request.user)
-        cart.items.all().delete()
+        if self.is_session_cart:
+            self.session_cart.clear()
+        else:
+            cart = get_object_or_404(Cart, user=request.user)
+            cart.items.all().delete()
         
-        cart_serializer = CartSerializer(cart)
-        return Response(cart_serializer.data)
+        return self.cart_response(request)
 
 
-class ProductListCreateAPIView(generics.ListCreateAPIView):
+class ProductListCreateAPIView(SparseFieldsQuerysetMixin, generics.ListCreateAPIView):
     throttle_scope = 'products'
     throttle_classes = [ScopedRateThrottle]
     queryset = Product.objects.select_related('category').filter(is_active=True).order_by('pk')
@@ -209,29 +425,26 @@ class ProductListCreateAPIView(generics.ListCreateAPIView):
     filterset_class = ProductFilter
     filter_backends = [
         DjangoFilterBackend, 
-        filters.SearchFilter,
+        FullTextSearchFilter,
         filters.OrderingFilter,
         InStockFilterBackend,
     ]
-    search_fields = ('=name', 'description', 'price')
     ordering_fields = ('name', 'price', 'stock', 'created_at', 'average_rating')
-    pagination_class = PageNumberPagination
-    pagination_class.page_size = 10
-    pagination_class.page_query_param = 'pagenum'
-    pagination_class.page_size_query_param = 'size'
-    pagination_class.max_page_size = 50
+    pagination_class = KeysetPagination
     
-    @method_decorator(cache_page(60*15, key_prefix='product_list'))
+    @property
+    def ordering(self):
+        # Full-text matches are listed by relevance unless the client asks for another ordering
+        request = getattr(self, 'request', None)
+        if request is not None and FullTextSearchFilter().get_search_query(request):
+            return ('-search_rank',)
+        return ('pk',)
+    
+    @method_decorator(conditional(product_list_validators))
+    @method_decorator(cache_response('product_list', product_list_tags, fresh_for=60*15))
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
     
-    def get_queryset(self):
-        qs = super().get_queryset()
-        category_slug = self.request.query_params.get('category', None)
-        if category_slug:
-            qs = qs.filter(category__slug=category_slug)
-        return qs
-    
     def get_permissions(self):
         self.permission_classes = [AllowAny]
         if self.request.method == 'POST':
@@ -239,12 +452,17 @@ class ProductListCreateAPIView(generics.ListCreateAPIView):
         return super().get_permissions()
 
 
-class ProductDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Product.objects.select_related('category').prefetch_related('reviews')
+class ProductDetailAPIView(SparseFieldsQuerysetMixin, generics.RetrieveUpdateDestroyAPIView):
+    queryset = Product.objects.select_related('category')
     serializer_class = ProductSerializer
     lookup_field = 'pk'
     lookup_url_kwarg = 'pk'
     
+    @method_decorator(conditional(product_detail_validators))
+    @method_decorator(cache_response('product_detail', product_detail_tags, fresh_for=60*15))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+    
     def get_permissions(self):
         self.permission_classes = [AllowAny]
         if self.request.method in ['PUT', 'PATCH','DELETE']:
@@ -257,10 +475,16 @@ class OrderListAPIView(generics.ListAPIView):
     serializer_class = OrderSerializer 
 
 
-class UserOrderListAPIView(generics.ListAPIView):
+class UserOrderListAPIView(SparseFieldsQuerysetMixin, generics.ListAPIView):
     queryset = Order.objects.prefetch_related('items__product')
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    ordering = ('-created_at',)
+    pagination_class = KeysetPagination
+    
+    @method_decorator(cache_response('user_orders', user_order_tags, fresh_for=60*15, per_user=True))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
     
     def get_queryset(self):
         qs = super().get_queryset()
@@ -268,32 +492,87 @@ class UserOrderListAPIView(generics.ListAPIView):
 
 
 class ProductInfoAPIView(APIView):
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, NDJSONRenderer]
+    chunk_size = 500
+    
     def get(self, request):
-        products = Product.objects.filter(is_active=True)
-        serializer = ProductInfoSerializer(data={
-            'products': products,
-            'count': products.count(),
-            'max_price': products.aggregate(Max('price'))['price__max']
-        })
-        serializer.is_valid(raise_exception=True)
-        return Response(serializer.data)
+        """
+        Catalogue dump of active products plus count/max price.
+        
+        ``?include=summary`` returns only the aggregates. The full dump is
+        streamed (JSON, or NDJSON with ``?format=ndjson``) while the products
+        are read in chunks, so memory stays flat as the catalogue grows.
+        """
+        if request.query_params.get('include') == 'summary':
+            return self.summary(request)
+        
+        products = Product.objects.select_related('category').filter(is_active=True).order_by('pk')
+        summary = ProductInfoSerializer(self.get_summary()).data
+        
+        if request.accepted_renderer.format == 'ndjson':
+            return StreamingHttpResponse(self.stream_ndjson(products, summary), content_type='application/x-ndjson')
+        return StreamingHttpResponse(self.stream_json(products, summary), content_type='application/json')
+    
+    @method_decorator(cache_response('product_info', product_info_tags, fresh_for=60*15))
+    def summary(self, request):
+        return Response(ProductInfoSerializer(self.get_summary()).data)
+    
+    def get_summary(self):
+        return Product.objects.filter(is_active=True).aggregate(count=Count('pk'), max_price=Max('price'))
+    
+    def serialized_chunks(self, products):
+        iterator = products.iterator(chunk_size=self.chunk_size)
+        while chunk := list(islice(iterator, self.chunk_size)):
+            yield ProductSerializer(chunk, many=True, context={'request': self.request}).data
+    
+    def stream_json(self, products, summary):
+        renderer = FastJSONRenderer()
+        # Reopen the summary object and splice the products array into it, one rendered chunk at a time
+        yield renderer.render(summary)[:-1] + b',"products":['
+        for index, rows in enumerate(self.serialized_chunks(products)):
+            yield (b',' if index else b'') + renderer.render(rows)[1:-1]
+        yield b']}'
+    
+    def stream_ndjson(self, products, summary):
+        renderer = NDJSONRenderer()
+        yield renderer.render(summary)
+        for rows in self.serialized_chunks(products):
+            yield renderer.render(rows)
+
+
+class CacheStatsAPIView(APIView):
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request):
+        """Hit/miss/stale counters for the cached endpoints"""
+        return Response(get_stats([
+            'product_list', 'product_detail', 'product_info', 'category_tree', 'order_list', 'user_orders'
+        ]))
 
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(SparseFieldsQuerysetMixin, viewsets.ModelViewSet):
     throttle_scope = 'orders'
     queryset = Order.objects.prefetch_related('items__product')
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
-    pagination_class = None
+    pagination_class = KeysetPagination
     filterset_class = OrderFilter
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     ordering_fields = ['created_at', 'status']
+    ordering = ('-created_at',)
     
-    @method_decorator(cache_page(60*15, key_prefix='order_list'))
-    @method_decorator(vary_on_headers('Authorization'))
+    @method_decorator(cache_response('order_list', order_list_tags, fresh_for=60*15, per_user=True))
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
     
+    @method_decorator(conditional(order_validators))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+    
+    @method_decorator(idempotent('order_create'))
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+    
     def perform_create(self, serializer):
         # Get or create user profile for shipping address default
         profile, _ = UserProfile.objects.get_or_create(user=self.request.user)
@@ -317,8 +596,9 @@ class OrderViewSet(viewsets.ModelViewSet):
         except Cart.DoesNotExist:
             pass
         
-        # Trigger the Celery task to send the order confirmation email
-        send_order_confirmation_email.delay(str(order.order_id), self.request.user.email)
+        # Trigger the Celery task to send the order confirmation email once the order is committed
+        email = self.request.user.email
+        transaction.on_commit(lambda: send_order_confirmation_email.delay(str(order.order_id), email))
 
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
@@ -360,32 +640,33 @@ class OrderViewSet(viewsets.ModelViewSet):
             )
         
         old_status = order.status
-        order.status = new_status
-        order.save()
-        
-        # Handle stock when order is cancelled
-        if new_status == Order.StatusChoices.CANCELLED and old_status != Order.StatusChoices.CANCELLED:
-            with transaction.atomic():
-                for item in order.items.all():
-                    # Return reserved stock
-                    item.product.reserved_stock -= item.quantity
-                    item.product.save()
-        
-        # Deduct from actual stock when delivered
-        if new_status == Order.StatusChoices.DELIVERED:
-            with transaction.atomic():
-                for item in order.items.all():
-                    # Deduct from actual stock and reserved stock
-                    item.product.stock -= item.quantity
-                    item.product.reserved_stock -= item.quantity
-                    item.product.save()
+        
+        with transaction.atomic():
+            # Re-read the status under a row lock so concurrent transitions can't both apply
+            current_status = Order.objects.select_for_update().values_list('status', flat=True).get(pk=order.pk)
+            if current_status != old_status:
+                raise Conflict(f'Order status changed to {current_status} while processing this request.')
+            
+            order.status = new_status
+            order.save()
+            
+            quantities = quantities_by_product((item.product_id, item.quantity) for item in order.items.all())
+            
+            # Return reserved stock when order is cancelled
+            if new_status == Order.StatusChoices.CANCELLED:
+                release_stock(quantities)
+            
+            # Deduct from actual stock and reserved stock when delivered
+            if new_status == Order.StatusChoices.DELIVERED:
+                consume_stock(quantities)
         
         serializer = self.get_serializer(order)
         return Response(serializer.data)
 
 
 class UserListView(generics.ListAPIView):
-    queryset = User.objects.all()
+    # Every user carries its nested profile, so join it instead of loading one per row
+    queryset = User.objects.select_related('profile').order_by('pk')
     serializer_class = UserSerializer
     pagination_class = None
     permission_classes = [IsAdminUser]